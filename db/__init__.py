@@ -4,10 +4,14 @@ from __future__ import annotations
 from contextlib import contextmanager
 from pathlib import Path
 import sqlite3
+import threading
 from typing import Iterator, Union
 
 _DB_PATH: Path | None = None
 _SCHEMA_PATH = Path(__file__).resolve().with_name("schema.sql")
+# Idle connection used only to poll PRAGMA data_version (see data_version()).
+_VERSION_CONN: tuple[Path, sqlite3.Connection] | None = None
+_VERSION_LOCK = threading.Lock()
 
 
 def configure(path: Union[str, Path]) -> Path:
@@ -62,11 +66,44 @@ def session(*, read_only: bool = False) -> Iterator[sqlite3.Connection]:
         conn.close()
 
 
+def data_version() -> int:
+    """Return a counter that changes whenever any other connection commits.
+
+    Every session opens its own connection, so the value comes from a dedicated
+    connection that never writes; PRAGMA data_version on it moves on each commit
+    made elsewhere (including other processes). Cheap enough to poll per request.
+    """
+    global _VERSION_CONN
+    db_path = path()
+    with _VERSION_LOCK:
+        if _VERSION_CONN is None or _VERSION_CONN[0] != db_path:
+            if _VERSION_CONN is not None:
+                _VERSION_CONN[1].close()
+            _VERSION_CONN = (db_path, sqlite3.connect(db_path, check_same_thread=False))
+        return int(_VERSION_CONN[1].execute("PRAGMA data_version").fetchone()[0])
+
+
+# Columns added to tables after they first shipped. CREATE TABLE IF NOT EXISTS
+# leaves existing tables alone, so these are ALTERed in before the script runs
+# (the script may index them).
+_ADDED_COLUMNS: tuple[tuple[str, str, str], ...] = (
+    ("video", "dir_id", "INTEGER"),
+)
+
+
+def _add_missing_columns(conn: sqlite3.Connection) -> None:
+    for table, column, decl in _ADDED_COLUMNS:
+        existing = {row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+        if existing and column not in existing:
+            conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {decl}')
+
+
 def ensure_schema() -> None:
     """Apply the bundled schema to the configured database."""
     sql = _SCHEMA_PATH.read_text()
     conn = connect()
     try:
+        _add_missing_columns(conn)
         conn.executescript(sql)
         conn.commit()
     finally:
@@ -78,5 +115,6 @@ __all__ = [
     "path",
     "connect",
     "session",
+    "data_version",
     "ensure_schema",
 ]
@@ -19,7 +19,8 @@ CREATE TABLE IF NOT EXISTS video (
   metadata_json TEXT,
   phash TEXT,
   created_at INTEGER NOT NULL,
-  updated_at INTEGER NOT NULL
+  updated_at INTEGER NOT NULL,
+  dir_id INTEGER
 );
 CREATE INDEX IF NOT EXISTS idx_video_mtime ON video(mtime_ns);
 CREATE INDEX IF NOT EXISTS idx_video_duration ON video(duration);
@@ -58,6 +59,41 @@ CREATE TABLE IF NOT EXISTS media_performers (
 );
 CREATE INDEX IF NOT EXISTS idx_media_performers_perf ON media_performers(performer_id);
 
+-- Materialised performer co-appearance graph. One row per unordered pair (a_id < b_id),
+-- kept in step with media_performers by the triggers below so graph queries never re-derive pairs.
+CREATE TABLE IF NOT EXISTS performer_edge (
+  a_id INTEGER NOT NULL REFERENCES performer(id) ON DELETE CASCADE,
+  b_id INTEGER NOT NULL REFERENCES performer(id) ON DELETE CASCADE,
+  count INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (a_id, b_id),
+  CHECK (a_id < b_id)
+);
+CREATE INDEX IF NOT EXISTS idx_performer_edge_b ON performer_edge(b_id);
+CREATE INDEX IF NOT EXISTS idx_performer_edge_count ON performer_edge(count);
+
+CREATE TRIGGER IF NOT EXISTS trg_media_performers_edge_insert
+AFTER INSERT ON media_performers
+BEGIN
+  INSERT INTO performer_edge (a_id, b_id, count)
+  SELECT MIN(NEW.performer_id, mp.performer_id), MAX(NEW.performer_id, mp.performer_id), 1
+    FROM media_performers mp
+   WHERE mp.media_id = NEW.media_id AND mp.performer_id <> NEW.performer_id
+  ON CONFLICT (a_id, b_id) DO UPDATE SET count = count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_media_performers_edge_delete
+AFTER DELETE ON media_performers
+BEGIN
+  UPDATE performer_edge
+     SET count = count - 1
+   WHERE (a_id, b_id) IN (
+     SELECT MIN(OLD.performer_id, mp.performer_id), MAX(OLD.performer_id, mp.performer_id)
+       FROM media_performers mp
+      WHERE mp.media_id = OLD.media_id AND mp.performer_id <> OLD.performer_id
+   );
+  DELETE FROM performer_edge WHERE count <= 0;
+END;
+
 -- Artifacts represent generated sidecars (thumbnail, preview, sprites, etc.).
 CREATE TABLE IF NOT EXISTS artifact (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -72,6 +108,62 @@ CREATE TABLE IF NOT EXISTS artifact (
 );
 CREATE INDEX IF NOT EXISTS idx_artifact_type ON artifact(type);
 
+-- Keyframe index per video (packed little-endian float64 pts seconds / int64 byte offsets),
+-- reused by sprite generation while the file's mtime/size match.
+CREATE TABLE IF NOT EXISTS keyframe_index (
+  media_id INTEGER PRIMARY KEY REFERENCES video(id) ON DELETE CASCADE,
+  mtime_ns INTEGER NOT NULL,
+  size_bytes INTEGER,
+  count INTEGER NOT NULL,
+  pts BLOB NOT NULL,
+  pos BLOB,
+  created_at INTEGER NOT NULL
+);
+
+-- Timeline markers. flags: 1 scene, 2 intro, 4 outro, 8 top-level point (the sidecar's
+-- intro/outro keys, one row per type), 16 produced by scene detection. payload_json keeps any
+-- extra per-marker keys (scene thumbnail/clip names). The UNIQUE key doubles as the
+-- (media_id, time) index used for per-video listing and next/previous lookups.
+CREATE TABLE IF NOT EXISTS marker (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  media_id INTEGER NOT NULL REFERENCES video(id) ON DELETE CASCADE,
+  time REAL NOT NULL,
+  type TEXT NOT NULL DEFAULT 'scene',
+  label TEXT,
+  name TEXT,
+  flags INTEGER NOT NULL DEFAULT 0,
+  score REAL,
+  payload_json TEXT,
+  UNIQUE (media_id, time, type)
+);
+CREATE INDEX IF NOT EXISTS idx_marker_label ON marker(label COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_marker_flagged ON marker(media_id, time) WHERE flags > 1;
+
+-- Videos whose <stem>.scenes.json sidecar has been folded into marker (imported once, so
+-- markers deleted in the DB are not resurrected from a stale sidecar).
+CREATE TABLE IF NOT EXISTS marker_sync (
+  media_id INTEGER PRIMARY KEY REFERENCES video(id) ON DELETE CASCADE,
+  synced_at INTEGER NOT NULL
+);
+
+-- Face embeddings (unit-length little-endian float32 vectors) for performer reference images
+-- (kind='performer', source=image path, label=performer name) and faces found in video frames
+-- (kind='video', source=video rel path, t=seconds). sig records the source image/sheet it came from.
+CREATE TABLE IF NOT EXISTS face_embedding (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  kind TEXT NOT NULL CHECK (kind IN ('performer', 'video')),
+  source TEXT NOT NULL,
+  t REAL NOT NULL DEFAULT 0,
+  label TEXT,
+  box TEXT,
+  sig TEXT,
+  dim INTEGER NOT NULL,
+  vec BLOB NOT NULL,
+  created_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_face_embedding_source ON face_embedding(kind, source);
+CREATE INDEX IF NOT EXISTS idx_face_embedding_label ON face_embedding(label);
+
 -- Jobs table mirrors the in-memory queue for persistence / recovery.
 CREATE TABLE IF NOT EXISTS job (
   id TEXT PRIMARY KEY,
@@ -92,6 +184,208 @@ CREATE TABLE IF NOT EXISTS job (
 CREATE INDEX IF NOT EXISTS idx_job_state ON job(state);
 CREATE INDEX IF NOT EXISTS idx_job_media ON job(media_id);
 
+-- Work items of aggregated batch jobs: one row per target file, drained by the shared worker pool.
+CREATE TABLE IF NOT EXISTS job_item (
+  job_id TEXT NOT NULL,
+  seq INTEGER NOT NULL,
+  target TEXT NOT NULL,
+  state TEXT NOT NULL DEFAULT 'queued',
+  attempts INTEGER NOT NULL DEFAULT 0,
+  error TEXT,
+  updated_at INTEGER NOT NULL,
+  PRIMARY KEY (job_id, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_job_item_state ON job_item(job_id, state);
+
+-- Directory dimension: one row per folder under MEDIA_ROOT ('' is the root itself).
+-- video.dir_id points at the containing folder; the closure table lists every
+-- (ancestor, descendant) pair so recursive scopes are an indexed equality lookup.
+CREATE TABLE IF NOT EXISTS directory (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  path TEXT NOT NULL UNIQUE,
+  parent_id INTEGER REFERENCES directory(id) ON DELETE CASCADE,
+  depth INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_directory_parent ON directory(parent_id);
+CREATE INDEX IF NOT EXISTS idx_video_dir ON video(dir_id);
+
+CREATE TABLE IF NOT EXISTS directory_closure (
+  ancestor_id INTEGER NOT NULL REFERENCES directory(id) ON DELETE CASCADE,
+  descendant_id INTEGER NOT NULL REFERENCES directory(id) ON DELETE CASCADE,
+  depth INTEGER NOT NULL,
+  PRIMARY KEY (ancestor_id, descendant_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_directory_closure_desc ON directory_closure(descendant_id);
+
+-- Parents are always inserted before children, so a new folder inherits its
+-- parent's ancestor rows plus the reflexive pair.
+CREATE TRIGGER IF NOT EXISTS trg_directory_closure_insert
+AFTER INSERT ON directory
+BEGIN
+  INSERT OR IGNORE INTO directory_closure (ancestor_id, descendant_id, depth)
+  VALUES (NEW.id, NEW.id, 0);
+  INSERT OR IGNORE INTO directory_closure (ancestor_id, descendant_id, depth)
+  SELECT ancestor_id, NEW.id, depth + 1 FROM directory_closure WHERE descendant_id = NEW.parent_id;
+END;
+
+-- Library statistics rollups keyed by (folder, metric). `direct` covers videos
+-- in that folder only, `tree` the folder plus every descendant, so any scoped
+-- or recursive stats read is a handful of primary-key lookups. Metrics:
+-- 'videos', 'size', 'duration', 'res:<bucket>', 'dur:<bucket>' and
+-- 'artifact:<type>' (present artifacts). Triggers apply each change to the
+-- folder and all of its ancestors through directory_closure; bucket bounds
+-- must match _db_scope_stats / _ROLLUP_*_BUCKET_SQL in app.py.
+CREATE TABLE IF NOT EXISTS directory_rollup (
+  dir_id INTEGER NOT NULL REFERENCES directory(id) ON DELETE CASCADE,
+  metric TEXT NOT NULL,
+  direct NUMERIC NOT NULL DEFAULT 0,
+  tree NUMERIC NOT NULL DEFAULT 0,
+  PRIMARY KEY (dir_id, metric)
+) WITHOUT ROWID;
+
+DROP TRIGGER IF EXISTS trg_video_rollup_insert;
+CREATE TRIGGER trg_video_rollup_insert
+AFTER INSERT ON video
+WHEN NEW.dir_id IS NOT NULL
+BEGIN
+  INSERT INTO directory_rollup (dir_id, metric, direct, tree)
+  SELECT c.ancestor_id, m.metric, CASE WHEN c.depth = 0 THEN m.value ELSE 0 END, m.value
+    FROM directory_closure AS c
+    JOIN (SELECT 'videos' AS metric, 1 AS value
+          UNION ALL SELECT 'size', COALESCE(NEW.size_bytes, 0)
+          UNION ALL SELECT 'duration', COALESCE(NEW.duration, 0)
+          UNION ALL SELECT CASE WHEN NEW.height IS NULL OR NEW.height < 360 THEN 'res:other' WHEN NEW.height >= 2160 THEN 'res:2160' WHEN NEW.height >= 1440 THEN 'res:1440' WHEN NEW.height >= 1080 THEN 'res:1080' WHEN NEW.height >= 720 THEN 'res:720' WHEN NEW.height >= 480 THEN 'res:480' ELSE 'res:360' END, 1
+          UNION ALL SELECT CASE WHEN NEW.duration IS NULL OR NEW.duration < 60 THEN 'dur:<1m' WHEN NEW.duration < 300 THEN 'dur:1-5m' WHEN NEW.duration < 1200 THEN 'dur:5-20m' WHEN NEW.duration < 3600 THEN 'dur:20-60m' ELSE 'dur:>60m' END, 1) AS m
+   WHERE c.descendant_id = NEW.dir_id
+  ON CONFLICT (dir_id, metric) DO UPDATE SET direct = direct + excluded.direct, tree = tree + excluded.tree;
+END;
+
+-- BEFORE so the video's artifacts are still visible; the cascaded artifact
+-- deletes then find no video row and leave the rollup alone.
+DROP TRIGGER IF EXISTS trg_video_rollup_delete;
+CREATE TRIGGER trg_video_rollup_delete
+BEFORE DELETE ON video
+WHEN OLD.dir_id IS NOT NULL
+BEGIN
+  INSERT INTO directory_rollup (dir_id, metric, direct, tree)
+  SELECT c.ancestor_id, m.metric, CASE WHEN c.depth = 0 THEN m.value ELSE 0 END, m.value
+    FROM directory_closure AS c
+    JOIN (SELECT 'videos' AS metric, -1 AS value
+          UNION ALL SELECT 'size', -COALESCE(OLD.size_bytes, 0)
+          UNION ALL SELECT 'duration', -COALESCE(OLD.duration, 0)
+          UNION ALL SELECT CASE WHEN OLD.height IS NULL OR OLD.height < 360 THEN 'res:other' WHEN OLD.height >= 2160 THEN 'res:2160' WHEN OLD.height >= 1440 THEN 'res:1440' WHEN OLD.height >= 1080 THEN 'res:1080' WHEN OLD.height >= 720 THEN 'res:720' WHEN OLD.height >= 480 THEN 'res:480' ELSE 'res:360' END, -1
+          UNION ALL SELECT CASE WHEN OLD.duration IS NULL OR OLD.duration < 60 THEN 'dur:<1m' WHEN OLD.duration < 300 THEN 'dur:1-5m' WHEN OLD.duration < 1200 THEN 'dur:5-20m' WHEN OLD.duration < 3600 THEN 'dur:20-60m' ELSE 'dur:>60m' END, -1) AS m
+   WHERE c.descendant_id = OLD.dir_id
+  ON CONFLICT (dir_id, metric) DO UPDATE SET direct = direct + excluded.direct, tree = tree + excluded.tree;
+  INSERT INTO directory_rollup (dir_id, metric, direct, tree)
+  SELECT c.ancestor_id, 'artifact:' || a.type, CASE WHEN c.depth = 0 THEN -1 ELSE 0 END, -1
+    FROM artifact AS a
+    JOIN directory_closure AS c ON c.descendant_id = OLD.dir_id
+   WHERE a.media_id = OLD.id AND a.status = 'present'
+  ON CONFLICT (dir_id, metric) DO UPDATE SET direct = direct + excluded.direct, tree = tree + excluded.tree;
+END;
+
+DROP TRIGGER IF EXISTS trg_video_rollup_update;
+CREATE TRIGGER trg_video_rollup_update
+AFTER UPDATE OF dir_id, size_bytes, duration, height ON video
+WHEN OLD.dir_id IS NOT NEW.dir_id
+  OR OLD.size_bytes IS NOT NEW.size_bytes
+  OR OLD.duration IS NOT NEW.duration
+  OR OLD.height IS NOT NEW.height
+BEGIN
+  INSERT INTO directory_rollup (dir_id, metric, direct, tree)
+  SELECT c.ancestor_id, m.metric, CASE WHEN c.depth = 0 THEN m.value ELSE 0 END, m.value
+    FROM directory_closure AS c
+    JOIN (SELECT 'videos' AS metric, -1 AS value
+          UNION ALL SELECT 'size', -COALESCE(OLD.size_bytes, 0)
+          UNION ALL SELECT 'duration', -COALESCE(OLD.duration, 0)
+          UNION ALL SELECT CASE WHEN OLD.height IS NULL OR OLD.height < 360 THEN 'res:other' WHEN OLD.height >= 2160 THEN 'res:2160' WHEN OLD.height >= 1440 THEN 'res:1440' WHEN OLD.height >= 1080 THEN 'res:1080' WHEN OLD.height >= 720 THEN 'res:720' WHEN OLD.height >= 480 THEN 'res:480' ELSE 'res:360' END, -1
+          UNION ALL SELECT CASE WHEN OLD.duration IS NULL OR OLD.duration < 60 THEN 'dur:<1m' WHEN OLD.duration < 300 THEN 'dur:1-5m' WHEN OLD.duration < 1200 THEN 'dur:5-20m' WHEN OLD.duration < 3600 THEN 'dur:20-60m' ELSE 'dur:>60m' END, -1) AS m
+   WHERE c.descendant_id = OLD.dir_id
+  ON CONFLICT (dir_id, metric) DO UPDATE SET direct = direct + excluded.direct, tree = tree + excluded.tree;
+  INSERT INTO directory_rollup (dir_id, metric, direct, tree)
+  SELECT c.ancestor_id, m.metric, CASE WHEN c.depth = 0 THEN m.value ELSE 0 END, m.value
+    FROM directory_closure AS c
+    JOIN (SELECT 'videos' AS metric, 1 AS value
+          UNION ALL SELECT 'size', COALESCE(NEW.size_bytes, 0)
+          UNION ALL SELECT 'duration', COALESCE(NEW.duration, 0)
+          UNION ALL SELECT CASE WHEN NEW.height IS NULL OR NEW.height < 360 THEN 'res:other' WHEN NEW.height >= 2160 THEN 'res:2160' WHEN NEW.height >= 1440 THEN 'res:1440' WHEN NEW.height >= 1080 THEN 'res:1080' WHEN NEW.height >= 720 THEN 'res:720' WHEN NEW.height >= 480 THEN 'res:480' ELSE 'res:360' END, 1
+          UNION ALL SELECT CASE WHEN NEW.duration IS NULL OR NEW.duration < 60 THEN 'dur:<1m' WHEN NEW.duration < 300 THEN 'dur:1-5m' WHEN NEW.duration < 1200 THEN 'dur:5-20m' WHEN NEW.duration < 3600 THEN 'dur:20-60m' ELSE 'dur:>60m' END, 1) AS m
+   WHERE c.descendant_id = NEW.dir_id
+  ON CONFLICT (dir_id, metric) DO UPDATE SET direct = direct + excluded.direct, tree = tree + excluded.tree;
+END;
+
+DROP TRIGGER IF EXISTS trg_video_rollup_move;
+CREATE TRIGGER trg_video_rollup_move
+AFTER UPDATE OF dir_id ON video
+WHEN OLD.dir_id IS NOT NEW.dir_id
+BEGIN
+  INSERT INTO directory_rollup (dir_id, metric, direct, tree)
+  SELECT c.ancestor_id, 'artifact:' || a.type, CASE WHEN c.depth = 0 THEN -1 ELSE 0 END, -1
+    FROM artifact AS a
+    JOIN directory_closure AS c ON c.descendant_id = OLD.dir_id
+   WHERE a.media_id = NEW.id AND a.status = 'present'
+  ON CONFLICT (dir_id, metric) DO UPDATE SET direct = direct + excluded.direct, tree = tree + excluded.tree;
+  INSERT INTO directory_rollup (dir_id, metric, direct, tree)
+  SELECT c.ancestor_id, 'artifact:' || a.type, CASE WHEN c.depth = 0 THEN 1 ELSE 0 END, 1
+    FROM artifact AS a
+    JOIN directory_closure AS c ON c.descendant_id = NEW.dir_id
+   WHERE a.media_id = NEW.id AND a.status = 'present'
+  ON CONFLICT (dir_id, metric) DO UPDATE SET direct = direct + excluded.direct, tree = tree + excluded.tree;
+END;
+
+DROP TRIGGER IF EXISTS trg_artifact_rollup_insert;
+CREATE TRIGGER trg_artifact_rollup_insert
+AFTER INSERT ON artifact
+WHEN NEW.status = 'present'
+BEGIN
+  INSERT INTO directory_rollup (dir_id, metric, direct, tree)
+  SELECT c.ancestor_id, 'artifact:' || NEW.type, CASE WHEN c.depth = 0 THEN 1 ELSE 0 END, 1
+    FROM video AS v
+    JOIN directory_closure AS c ON c.descendant_id = v.dir_id
+   WHERE v.id = NEW.media_id AND NEW.status = 'present'
+  ON CONFLICT (dir_id, metric) DO UPDATE SET direct = direct + excluded.direct, tree = tree + excluded.tree;
+END;
+
+DROP TRIGGER IF EXISTS trg_artifact_rollup_delete;
+CREATE TRIGGER trg_artifact_rollup_delete
+AFTER DELETE ON artifact
+WHEN OLD.status = 'present'
+BEGIN
+  INSERT INTO directory_rollup (dir_id, metric, direct, tree)
+  SELECT c.ancestor_id, 'artifact:' || OLD.type, CASE WHEN c.depth = 0 THEN -1 ELSE 0 END, -1
+    FROM video AS v
+    JOIN directory_closure AS c ON c.descendant_id = v.dir_id
+   WHERE v.id = OLD.media_id AND OLD.status = 'present'
+  ON CONFLICT (dir_id, metric) DO UPDATE SET direct = direct + excluded.direct, tree = tree + excluded.tree;
+END;
+
+DROP TRIGGER IF EXISTS trg_artifact_rollup_update;
+CREATE TRIGGER trg_artifact_rollup_update
+AFTER UPDATE OF status, type, media_id ON artifact
+WHEN OLD.status = 'present' OR NEW.status = 'present'
+BEGIN
+  INSERT INTO directory_rollup (dir_id, metric, direct, tree)
+  SELECT c.ancestor_id, 'artifact:' || OLD.type, CASE WHEN c.depth = 0 THEN -1 ELSE 0 END, -1
+    FROM video AS v
+    JOIN directory_closure AS c ON c.descendant_id = v.dir_id
+   WHERE v.id = OLD.media_id AND OLD.status = 'present'
+  ON CONFLICT (dir_id, metric) DO UPDATE SET direct = direct + excluded.direct, tree = tree + excluded.tree;
+  INSERT INTO directory_rollup (dir_id, metric, direct, tree)
+  SELECT c.ancestor_id, 'artifact:' || NEW.type, CASE WHEN c.depth = 0 THEN 1 ELSE 0 END, 1
+    FROM video AS v
+    JOIN directory_closure AS c ON c.descendant_id = v.dir_id
+   WHERE v.id = NEW.media_id AND NEW.status = 'present'
+  ON CONFLICT (dir_id, metric) DO UPDATE SET direct = direct + excluded.direct, tree = tree + excluded.tree;
+END;
+
+-- One-off data backfills that have run against this database (name -> when).
+-- Keyed by the table they populate; see _db_run_data_migrations in app.py.
+CREATE TABLE IF NOT EXISTS data_migration (
+  name TEXT PRIMARY KEY,
+  applied_at INTEGER NOT NULL
+);
+
 -- Schema version tracking (Alembic-lite). Row id stays fixed at 1; bump version via migrations.
 CREATE TABLE IF NOT EXISTS schema_version (
   id INTEGER PRIMARY KEY CHECK (id = 1),
@@ -18,7 +18,7 @@ import uuid
 import shlex
 import logging
 import asyncio
-from tools.idle_worker import IdleWorker  # type: ignore
+from tools.idle_worker import IdlePlanner, IdleWorker  # type: ignore
 
 _IDLE_WORKER_INST: Optional[IdleWorker] = None
 
@@ -34,6 +34,8 @@ def _idle_conf_app() -> dict:
         "min_idle_seconds": int(_get("min_idle_seconds", 60)),
         "poll_seconds": int(_get("poll_seconds", 15)),
         "max_concurrent": int(_get("max_concurrent", 1)),
+        "batch_seconds": float(_get("batch_seconds", 60)),
+        "max_batch": int(_get("max_batch", 200)),
         "artifacts": list(_get("artifacts", [
             "metadata", "thumbnail", "preview", "sprites", "phash", "heatmap", "faces"
         ])),
@@ -42,51 +44,26 @@ def _idle_conf_app() -> dict:
 def _idle_active_jobs_app() -> int:
     try:
         with JOB_LOCK:
-            return sum(1 for j in JOBS.values() if str(j.get("state")).lower() == "running")
+            # Queued jobs count too: idle batches wait on JOB_RUN_SEM before they show as running
+            return sum(1 for j in JOBS.values() if str(j.get("state")).lower() in ("running", "queued"))
     except Exception:
         return 0
 
-def _artifact_missing_app(kind: str, v: Path) -> bool:
-    k = kind.lower()
-    try:
-        if k == "metadata":
-            return not metadata_path(v).exists()
-        if k == "thumbnail":
-            p = thumbnails_path(v)
-            if p.exists():
-                return False
-            sib = v.parent / f"{v.stem}{SUFFIX_THUMBNAIL_JPG}"
-            return not sib.exists()
-        if k == "preview":
-            return not (_file_nonempty(preview_webm_path(v)) or _file_nonempty(preview_mp4_path(v)))
-        if k == "sprites":
-            jpg, jsonp = sprite_sheet_paths(v)
-            return not (jpg.exists() and jsonp.exists())
-        if k == "heatmap":
-            return not heatmap_json_exists(v)
-        if k == "phash":
-            return not phash_path(v).exists()
-        if k == "faces":
-            return not faces_exists_check(v)
-    except Exception:
-        return False
-    return False
+def _idle_fetch_missing_app(base: Path, kind: str, limit: int, exclude: list[str]) -> list[str]:
+    """Planner refill: newest videos missing `kind`, from the artifact/video tables."""
+    art_type = {"thumbnails": "thumbnail", "previews": "preview"}.get(kind, kind)
+    if art_type not in _ARTIFACT_TYPE_TO_COVERAGE_KEY:
+        return []  # not tracked in the artifact table
+    return _db_missing_artifacts(base, STATE["root"], art_type, limit=limit, exclude=exclude)
+
+_IDLE_PLANNER = IdlePlanner(fetch_fn=_idle_fetch_missing_app)
 
-def _idle_pick_next_missing_app(base: Path, kinds: list[str]) -> tuple[Optional[str], Optional[str]]:
-    vids = _iter_videos(base, recursive=True)
-    for k in kinds:
-        for v in vids:
-            try:
-                if _artifact_missing_app(k, v):
-                    rel = str(v.relative_to(STATE["root"])) if str(v).startswith(str(STATE["root"])) else str(v)
-                    return k, rel
-            except Exception:
-                continue
-    return None, None
+def _idle_plan_app(base: Path, kinds: list[str], slots: int, batch_size: int) -> list[tuple[str, list[str]]]:
+    return _IDLE_PLANNER.next_batches(base, kinds, slots, batch_size)
 
-def _idle_submit_app(task: str, relpath: str) -> Optional[str]:
+def _idle_submit_batch_app(task: str, relpaths: list[str]) -> Optional[str]:
     try:
-        jr = JobRequest(task=task, directory=str(STATE["root"]), recursive=False, force=False, params={"targets": [relpath]})
+        jr = JobRequest(task=task, directory=str(STATE["root"]), recursive=False, force=False, params={"targets": list(relpaths), "resource_class": "idle"})
         out = jobs_submit(jr)
         jid = (out or {}).get("id") if isinstance(out, dict) else None
         return str(jid) if jid else None
@@ -105,8 +82,8 @@ async def _on_startup_idle_worker():  # pragma: no cover
         conf_getter=_idle_conf_app,
         base_path=STATE["root"].resolve(),
         active_jobs_fn=_idle_active_jobs_app,
-        pick_next_fn=_idle_pick_next_missing_app,
-        submit_fn=_idle_submit_app,
+        plan_fn=_idle_plan_app,
+        submit_batch_fn=_idle_submit_batch_app,
     )
     _IDLE_WORKER_INST.start()
 
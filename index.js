@@ -10557,7 +10557,9 @@ const Player = (() => {
   // relative path from /api library
   let duration = 0;
   let sprites = null;
-  // {index, sheet}
+  // {index, sheet, levels}; levels = sprite pyramid from /api/sprites/json (level 0 = sheet)
+  const spriteSheetState = new Map();
+  // pyramid sheet url -> 'loading' | 'ready' | 'failed'
   let scenes = [];
   let introEnd = null;
   let outroBegin = null;
@@ -13359,6 +13361,7 @@ const Player = (() => {
   async function loadSprites() {
     // initialize
     sprites = null;
+    spriteSheetState.clear();
     if (!currentPath) return;
     const st = window.__artifactStatus && window.__artifactStatus[currentPath];
     if (st && st.sprites === false) {
@@ -13376,8 +13379,9 @@ const Player = (() => {
       const data = await r.json();
       const index = data?.data?.index;
       const sheet = data?.data?.sheet;
+      const levels = Array.isArray(data?.data?.levels) ? data.data.levels : null;
       if (index && sheet) {
-        sprites = {index, sheet};
+        sprites = {index, sheet, levels};
         if (badgeSpritesStatus) badgeSpritesStatus.textContent = '✓';
         if (badgeSprites) badgeSprites.dataset.present = '1';
         const img = document.getElementById('sidebarSpriteImage');
@@ -14103,6 +14107,37 @@ const Player = (() => {
     attach(bPreview, 'preview');
     attach(bPhash, 'phash');
   }
+  // Start fetching a pyramid sheet once; true when it is loaded and safe to show
+  function ensureSpriteSheet(url) {
+    const state = spriteSheetState.get(url);
+    if (state) return state === 'ready';
+    spriteSheetState.set(url, 'loading');
+    const img = new Image();
+    img.decoding = 'async';
+    img.onload = () => spriteSheetState.set(url, 'ready');
+    img.onerror = () => spriteSheetState.set(url, 'failed');
+    img.src = url;
+    return false;
+  }
+  // Tile for time t from the finest pyramid level whose sheet is loaded. Only the finest
+  // level's sheet is requested on demand; until it arrives a coarser one (or level 0) is used.
+  function pickSpritePyramidTile(t, tiles) {
+    const levels = sprites && Array.isArray(sprites.levels) ? sprites.levels : [];
+    for (let i = levels.length - 1; i > 0; i--) {
+      const lv = levels[i] || {};
+      const span = Number(lv.span);
+      const interval = Number(lv.interval);
+      const urls = Array.isArray(lv.sheet_urls) ? lv.sheet_urls : [];
+      if (!(span > 0) || !(interval > 0) || !urls.length) continue;
+      const sheetIdx = Math.min(urls.length - 1, Math.max(0, Math.floor(t / span)));
+      const url = urls[sheetIdx];
+      const ready = i === levels.length - 1 ? ensureSpriteSheet(url) : spriteSheetState.get(url) === 'ready';
+      if (!ready) continue;
+      const frame = Math.min(tiles - 1, Math.max(0, Math.floor((t - sheetIdx * span) / interval)));
+      return {url, frame};
+    }
+    return null;
+  }
   function handleSpriteHover(evt) {
     if ((!sprites || !sprites.index || !sprites.sheet) && currentPath) {
       const st = window.__artifactStatus && window.__artifactStatus[currentPath];
@@ -14222,6 +14257,9 @@ const Player = (() => {
         frame = Math.floor((t / Math.max(0.1, vidDur)) * (totalFrames - 1));
       }
       frame = Math.min(totalFrames - 1, Math.max(0, frame));
+      // A loaded finer pyramid sheet replaces the level-0 tile (same cols x rows grid)
+      const fine = pickSpritePyramidTile(t, cols * rows);
+      if (fine) frame = fine.frame;
       const col = frame % cols;
       const row = Math.floor(frame / cols);
       // Use integer-scaled tile dimensions to avoid subpixel rounding artifacts
@@ -14239,7 +14277,7 @@ const Player = (() => {
         preImg.loading = 'eager';
         preImg.src = window.__spriteSheetUrlCache;
       }
-      const sheetUrl = window.__spriteSheetUrlCache;
+      const sheetUrl = fine ? fine.url : window.__spriteSheetUrlCache;
       if (!sheetUrl) {
         hideSprite();
         return;
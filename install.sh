@@ -34,12 +34,15 @@ REQUIRED_PKGS=(
 # Raspberry Pi friendly, headless set:
 # - opencv-python-headless: Face detection without GUI deps
 # - numpy: required by face pipelines
+# - orjson / brotli: faster JSON rendering and br compression for large API responses
 # Subtitles on Pi default to whisper.cpp (built automatically on Linux when --optional is used).
 # If you explicitly want faster-whisper, install it manually: `pip install faster-whisper`
 # (requires FFmpeg dev libs for PyAV on ARM).
 OPTIONAL_PKGS=(
   opencv-python-headless
   numpy
+  orjson
+  brotli
 )
 
 usage() {
@@ -1,7 +1,12 @@
 import json
+import os
+import re
+import subprocess
+import sys
 import threading
 import time
 from io import BytesIO
+from pathlib import Path
 
 from fastapi import UploadFile
 from fastapi.responses import JSONResponse
@@ -507,3 +512,1097 @@ def test_jobs_backup_import_round_trip(media_root, job_state, monkeypatch):
     assert jid in app.JOBS
     assert app.JOBS[jid]["state"] == "restored"
 
+
+
+def test_performers_graph_uses_materialised_edges(media_root):
+    a = _write_video_with_sidecars(media_root, "a.mp4", phash_hex="01")
+    b = _write_video_with_sidecars(media_root, "b.mp4", phash_hex="02")
+    _set_media_attr_entry(a, performers=["Alice", "Bob", "Cara"])
+    rel_b = _set_media_attr_entry(b, performers=["Alice", "Bob"])
+
+    with db.session(read_only=True) as conn:
+        rows = conn.execute("SELECT count FROM performer_edge ORDER BY count DESC").fetchall()
+    assert [int(r["count"]) for r in rows] == [2, 1, 1]
+
+    resp = app.api_performers_graph(min_count=1, limit_videos_per_edge=6, min_edge_count=2, top_k=None, performer=None)
+    data = json.loads(bytes(resp.body))["data"]
+    assert [e["id"] for e in data["edges"]] == ["alice|bob"]
+    assert sorted(data["edges"][0]["videos"]) == ["a.mp4", "b.mp4"]
+
+    ego = json.loads(bytes(app.api_performers_graph(min_count=1, limit_videos_per_edge=0, min_edge_count=1,
+                                                    top_k=None, performer="Cara").body))["data"]
+    assert {n["slug"] for n in ego["nodes"]} == {"alice", "bob", "cara"}
+    assert len(ego["edges"]) == 3
+
+    app._MEDIA_ATTR[rel_b]["performers"] = ["Alice"]
+    app._save_media_attr([rel_b])
+    with db.session(read_only=True) as conn:
+        assert conn.execute("SELECT MAX(count) AS c FROM performer_edge").fetchone()["c"] == 1
+
+    # Upgraded database: links predate the triggers and one edge was written since.
+    # The startup backfill is gated by its data_migration marker, not an empty table.
+    with db.session() as conn:
+        conn.execute("DELETE FROM performer_edge WHERE rowid IN (SELECT rowid FROM performer_edge LIMIT 2)")
+        conn.execute("DELETE FROM data_migration WHERE name = 'performer_edge'")
+    assert "performer_edge" in app._db_run_data_migrations()
+    with db.session(read_only=True) as conn:
+        assert [int(r["count"]) for r in conn.execute("SELECT count FROM performer_edge ORDER BY count DESC")] == [1, 1, 1]
+    assert app._db_run_data_migrations() == []
+
+
+def test_gray_frame_stats_streams_brightness_and_motion(media_root, monkeypatch):
+    video = _write_video_with_sidecars(media_root, "motion.mp4", phash_hex="03", width=320, height=180)
+    size = app._gray_stats_size(video)
+    assert size == (160, 90)
+    frames = [bytes([0]) * (160 * 90), bytes([255]) * (160 * 90), bytes([255]) * (160 * 90)]
+    seen: dict[str, object] = {}
+
+    def fake_frames(v, *, interval, size, keyframes_only=False, cancel_check=None):
+        seen["size"] = size
+        yield from frames
+
+    monkeypatch.setattr(app, "_iter_gray_frames", fake_frames)
+    stats = app._gray_frame_stats(video, interval=2.0)
+    assert seen["size"] == (160, 90)
+    assert [s["t"] for s in stats] == [0.0, 2.0, 4.0]
+    assert [s["b"] for s in stats] == [0.0, 1.0, 1.0]
+    assert [s["m"] for s in stats] == [0.0, 1.0, 0.0]
+
+
+def test_thumbnail_batch_engine_chunks_ffmpeg_and_uses_db_durations(media_root, monkeypatch):
+    videos = [_write_video_with_sidecars(media_root, f"clip{i}.mp4", phash_hex="04", duration=8.0) for i in range(5)]
+    with db.session() as conn:
+        for v in videos:
+            app._db_backfill_single_video(conn, v)
+    calls: list[list[str]] = []
+
+    def fake_run(cmd):
+        calls.append(cmd)
+        outs = [c for c in cmd if c.endswith(app.SUFFIX_THUMBNAIL_JPG)]
+        for out in outs:
+            app.Path(out).write_bytes(b"\xff\xd8jpeg")
+        return app.subprocess.CompletedProcess(cmd, 0, "", "")
+
+    monkeypatch.setattr(app, "_run", fake_run)
+    monkeypatch.setattr(app, "ffmpeg_available", lambda: True)
+    monkeypatch.setattr(app, "metadata_single", lambda *a, **k: (_ for _ in ()).throw(AssertionError("probe")))
+    progress: list[int] = []
+    result = app.generate_thumbnails_batch(videos, time_spec="middle", workers=1, chunk_size=4, backend="ffmpeg",
+                                           progress_cb=lambda done, total, v: progress.append(done))
+    assert result["written"] == 5 and not result["failed"]
+    assert len(calls) == 2
+    assert calls[0].count("-i") == 4
+    assert calls[0][calls[0].index("-ss") + 1] == "4.000"
+    assert progress[-1] == 5
+    with db.session(read_only=True) as conn:
+        row = conn.execute("SELECT COUNT(*) AS c FROM artifact WHERE type = 'thumbnail'").fetchone()
+    assert row["c"] == 5
+
+    again = app.generate_thumbnails_batch(videos, backend="ffmpeg")
+    assert again["skipped"] == 5 and again["processed"] == 0
+
+
+def test_headless_import_stays_within_cold_start_budget(tmp_path):
+    budget = float(os.environ.get("APP_IMPORT_BUDGET_SEC", "3.0"))
+    probe = (
+        "import json, time\n"
+        "t0 = time.perf_counter()\n"
+        "from tools import artifact_lib\n"
+        "mod = artifact_lib.load_app()\n"
+        "elapsed = time.perf_counter() - t0\n"
+        "print(json.dumps({'elapsed': elapsed, 'headless': mod.HEADLESS, 'routes': len(mod.app.routes),\n"
+        "                  'media_attr': mod._MEDIA_ATTR_LOADED, 'batch_exec': mod._BATCH_EXEC is not None,\n"
+        "                  'thumb': callable(artifact_lib.generate_thumbnail)}))\n"
+    )
+    env = dict(os.environ)
+    env.pop("MEDIA_PLAYER_HEADLESS", None)
+    env.update({"MEDIA_ROOT": str(tmp_path), "MEDIA_PLAYER_STATE_DIR": str(tmp_path / "state"), "PYTHONWARNINGS": "ignore"})
+    repo = Path(__file__).resolve().parents[1]
+    samples = []
+    for _ in range(2):
+        out = subprocess.run([sys.executable, "-c", probe], cwd=str(repo), env=env, capture_output=True, text=True, timeout=120)
+        assert out.returncode == 0, out.stderr
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    best = min(samples, key=lambda s: s["elapsed"])
+    assert best["headless"] and best["routes"] == 0 and best["thumb"]
+    assert not best["media_attr"] and not best["batch_exec"]
+    assert best["elapsed"] < budget, f"cold import took {best['elapsed']:.2f}s (budget {budget:.2f}s)"
+    assert not (tmp_path / ".artifacts").exists()
+
+
+def test_sprite_keyframe_engine_uses_cached_index(media_root, monkeypatch):
+    video = _write_video_with_sidecars(media_root, "kf.mp4", phash_hex="05", duration=20.0, width=320, height=180)
+    probes: list[str] = []
+
+    def fake_probe(path, cancel_check=None):
+        probes.append(path.name)
+        return [float(t) for t in range(0, 20, 2)], [100 * t for t in range(0, 20, 2)]
+
+    seen: dict = {}
+
+    def fake_frames(cmd, frame_bytes, *, cancel_check=None, frame_pts=False):
+        seen["cmd"] = cmd
+        seen["frame_bytes"] = frame_bytes
+        assert frame_pts and cmd[cmd.index("-vf") + 1].endswith(",showinfo")
+        times = [float(t) for t in re.findall(r"abs\(t-([0-9.]+)", cmd[cmd.index("-vf") + 1])]
+        # an unrequested keyframe and a repeated one must not shift later tiles
+        for t in [0.0, times[0], *times]:
+            if t != seen.get("drop"):
+                yield t, bytes([int(t) * 10]) * frame_bytes
+
+    monkeypatch.setattr(app, "ffprobe_available", lambda: True)
+    monkeypatch.setattr(app, "_keyframe_probe", fake_probe)
+    monkeypatch.setattr(app, "_iter_ffmpeg_raw_frames", fake_frames)
+    assert app._sprite_sheet_keyframe_engine(video, width=32, cols=2, rows=2, quality=4)
+    sheet, index_json = app.sprite_sheet_paths(video)
+    meta = json.loads(index_json.read_text())
+    assert [f["t"] for f in meta["frames"]] == [2.0, 8.0, 12.0, 18.0]
+    assert meta["tile_width"] == 32 and meta["tile_height"] == 18
+    assert seen["frame_bytes"] == 32 * 18 * 3 and "-skip_frame" in seen["cmd"]
+    with app.Image.open(sheet) as im:
+        assert im.size == (64, 36)
+        tiles = [im.getpixel(((k % 2) * 32 + 16, (k // 2) * 18 + 9))[0] for k in range(4)]
+        assert all(abs(got - want) <= 3 for got, want in zip(tiles, [20, 80, 120, 180])), tiles
+    # a keyframe ffmpeg never delivers is filled from the decoded one nearest in time (6.0, wanted
+    # by a finer pyramid level), not from the last frame of the pass
+    seen["drop"] = 8.0
+    assert app._sprite_sheet_keyframe_engine(video, width=32, cols=2, rows=2, quality=4)
+    with app.Image.open(sheet) as im:
+        tiles = [im.getpixel(((k % 2) * 32 + 16, (k // 2) * 18 + 9))[0] for k in range(4)]
+        assert all(abs(got - want) <= 3 for got, want in zip(tiles, [20, 60, 120, 180])), tiles
+
+    again = app._keyframe_index(video)
+    assert again["cached"] and again["pos"][1] == 200
+    assert probes == ["kf.mp4"]
+    video.write_bytes(b"1" * 2048)
+    assert app._keyframe_index(video)["cached"] is False
+    assert probes == ["kf.mp4", "kf.mp4"]
+
+
+def test_sprite_pyramid_one_pass_and_webvtt_track(media_root, monkeypatch):
+    video = _write_video_with_sidecars(media_root, "long.mp4", phash_hex="07", duration=400.0, width=320, height=180)
+    monkeypatch.setenv("SPRITES_PYRAMID_LEVELS", "2")
+    monkeypatch.setattr(app, "ffprobe_available", lambda: True)
+    monkeypatch.setattr(app, "_keyframe_probe", lambda path, cancel_check=None: ([float(t) for t in range(400)], list(range(400))))
+    runs: list[int] = []
+
+    def fake_frames(cmd, frame_bytes, *, cancel_check=None, frame_pts=False):
+        times = [float(t) for t in re.findall(r"abs\(t-([0-9.]+)", cmd[cmd.index("-vf") + 1])]
+        runs.append(len(times))
+        for i, t in enumerate(times):
+            yield t, bytes([i % 250]) * frame_bytes
+
+    monkeypatch.setattr(app, "_iter_ffmpeg_raw_frames", fake_frames)
+    assert [lv["sheets"] for lv in app._sprite_pyramid_layout(400.0, 4)] == [1, 4, 16]
+    assert app._sprite_sheet_keyframe_engine(video, width=32, cols=2, rows=2, quality=4)
+    assert runs == [1 * 4 + 4 * 4 + 16 * 4]  # every level from a single decode pass
+    sheet, index_json = app.sprite_sheet_paths(video)
+    meta = json.loads(index_json.read_text())
+    assert [(lv["level"], lv["sheets"], lv["interval"]) for lv in meta["pyramid"]["levels"]] == [
+        (0, 1, 100.0), (1, 4, 25.0), (2, 16, 6.25),
+    ]
+    assert len(list(app.sprite_pyramid_dir(video).glob("L*_*.jpg"))) == 20
+    with app.Image.open(app.sprite_pyramid_sheet_path(video, 2, 15)) as im:
+        assert im.size == (64, 36)
+
+    rel = _relative_path(video)
+    info = json.loads(bytes(app.sprites_json(path=rel).body))["data"]
+    assert [len(lv["sheet_urls"]) for lv in info["levels"]] == [1, 4, 16]
+    vtt = app.sprites_vtt(path=rel, level=None).body.decode()
+    cues = [line for line in vtt.splitlines() if "-->" in line]
+    assert vtt.startswith("WEBVTT") and len(cues) == 64
+    assert cues[-1] == "00:06:33.750 --> 00:06:40.000"
+    assert "/api/sprites/sheet?path=long.mp4&level=2&index=15#xywh=32,18,32,18" in vtt
+    coarse = app.sprites_vtt(path=rel, level=0).body.decode()
+    assert "00:01:40.000 --> 00:03:20.000\n/api/sprites/sheet?path=long.mp4#xywh=32,0,32,18" in coarse
+
+
+def test_sprite_pyramid_long_video_avoids_huge_select_and_cleans_staging(media_root, monkeypatch):
+    video = _write_video_with_sidecars(media_root, "feature.mp4", phash_hex="08", duration=10800.0, width=320, height=180)
+    pts = [i * 0.5 for i in range(21600)]
+    monkeypatch.setattr(app, "ffprobe_available", lambda: True)
+    monkeypatch.setattr(app, "_keyframe_probe", lambda path, cancel_check=None: (pts, list(range(len(pts)))))
+    seen: dict = {}
+
+    def fake_frames(cmd, frame_bytes, *, cancel_check=None, frame_pts=False):
+        seen["vf"] = cmd[cmd.index("-vf") + 1]
+        for t in pts:
+            if seen.get("fail") and t > 600:
+                raise RuntimeError("canceled")
+            yield t, bytes([int(t) % 250]) * frame_bytes
+
+    monkeypatch.setattr(app, "_iter_ffmpeg_raw_frames", fake_frames)
+    assert app._sprite_sheet_keyframe_engine(video, width=32, cols=8, rows=8, quality=4)
+    # thousands of wanted keyframes: every keyframe is piped rather than spelled out in a select
+    assert "select=" not in seen["vf"] and len(seen["vf"]) < 1000
+    assert len(json.loads(app.sprite_sheet_paths(video)[1].read_text())["pyramid"]["levels"]) > 2
+    staging = app.sprite_pyramid_dir(video).with_name(app.sprite_pyramid_dir(video).name + ".tmp")
+    assert not staging.exists()
+
+    seen["fail"] = True
+    try:
+        app._sprite_sheet_keyframe_engine(video, width=32, cols=8, rows=8, quality=4)
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("engine swallowed the decode failure")
+    assert not staging.exists()
+    assert not list(app.sprite_sheet_paths(video)[0].parent.glob("*.tmp"))
+
+
+def test_keyframes_artifact_round_trip_and_alignment(media_root, monkeypatch):
+    video = _write_video_with_sidecars(media_root, "seek.mp4", phash_hex="06", duration=30.0)
+    monkeypatch.setattr(app, "ffprobe_available", lambda: True)
+    monkeypatch.setattr(app, "_keyframe_probe", lambda path, cancel_check=None: ([0.0, 4.0, 8.0, 12.0], [48, 9000, 18000, 27000]))
+    with db.session() as conn:
+        app._db_backfill_single_video(conn, video)
+
+    assert app._keyframe_align(video, [5.0]) == [5.0]  # nothing cached yet, never probes
+    out = app.generate_keyframe_index(video)
+    assert out == app.keyframes_path(video) and out.read_bytes()[:4] == b"MPKF"
+    side = app._read_keyframes_file(out)
+    assert side["pts"] == [0.0, 4.0, 8.0, 12.0] and side["pos"][2] == 18000
+    assert app._artifact_exists(video, "keyframes") and "keyframes" in app.ARTIFACT_KEYS
+    with db.session(read_only=True) as conn:
+        row = conn.execute("SELECT path FROM artifact WHERE type = 'keyframes'").fetchone()
+    assert row["path"].endswith(".keyframes.bin")
+
+    assert app._keyframe_align(video, [4.6, 10.0, 29.0]) == [4.0, 10.0, 29.0]
+    lookup = app.keyframes_lookup(path="seek.mp4", t=9.5)
+    body = json.loads(lookup.body)["data"]
+    assert body["time"] == 8.0 and body["pos"] == 18000 and body["next_pos"] == 27000
+
+    # Probe pts are rebased onto the container start (MPEG-TS style offset) for -ss seeks
+    lines = [
+        "pts_time=1.400000|dts_time=1.400000|pos=564|flags=K__",
+        "pts_time=1.433333|dts_time=1.433333|pos=900|flags=___",
+        "pts_time=3.400000|dts_time=3.400000|pos=9000|flags=K__",
+        "start_time=1.400000",
+    ]
+    assert app._keyframe_probe_parse(lines) == ([0.0, 2.0], [564, 9000])
+
+    # The sidecar alone is enough to rebuild the DB cache
+    with db.session() as conn:
+        conn.execute("DELETE FROM keyframe_index")
+    monkeypatch.setattr(app, "_keyframe_probe", lambda *a, **k: (_ for _ in ()).throw(AssertionError("probe")))
+    assert app._keyframe_index(video, build=False)["cached"]
+
+
+def test_scene_detection_streams_downscaled_scores_and_batches_exports(media_root, monkeypatch):
+    video = _write_video_with_sidecars(media_root, "cuts.mp4", phash_hex="07", duration=60.0, width=1920, height=1080)
+    lines = [
+        "progress=continue\n", "out_time_us=4000000\n",
+        "frame:120  pts:61440   pts_time:5.005\n", "lavfi.scene_score=0.512000\n",
+        "frame:121  pts:61952   pts_time:5.1\n", "lavfi.scene_score=0.400000\n",  # deduped (< 0.25s apart)
+        "out_time_us=30000000\n",
+        "frame:900  pts:460800  pts_time:37.5\n", "lavfi.scene_score=0.330000\n",
+        "progress=end\n",
+    ]
+    popen_cmds: list[list[str]] = []
+
+    class FakeProc:
+        pid = 0
+        returncode = 0
+
+        def __init__(self, cmd, **kwargs):
+            popen_cmds.append(cmd)
+            self.stdout = iter(lines)
+
+        def wait(self, timeout=None):
+            return 0
+
+        def poll(self):
+            return 0
+
+    runs: list[list[str]] = []
+
+    def fake_run(cmd):
+        runs.append(cmd)
+        for arg in cmd:
+            if arg.endswith((".jpg", ".mp4")) and arg != str(video):
+                Path(arg).write_bytes(b"x")
+        return subprocess.CompletedProcess(cmd, 0, "", "")
+
+    monkeypatch.setattr(app, "ffmpeg_available", lambda: True)
+    monkeypatch.setattr(app.subprocess, "Popen", FakeProc)
+    monkeypatch.setattr(app, "_run", fake_run)
+    app.generate_scene_artifacts(
+        video, threshold=0.3, limit=0, gen_thumbnails=True, gen_clips=True,
+        thumbnails_width=320, clip_duration=2.0,
+    )
+    vf = popen_cmds[0][popen_cmds[0].index("-vf") + 1]
+    assert vf.startswith("scale='min(320,iw)'") and "metadata=mode=print" in vf and "value=0.3" in vf
+    assert "pipe:1" in popen_cmds[0]
+    scenes = json.loads(app.scenes_json_path(video).read_text())["scenes"]
+    assert [(s["time"], s["score"]) for s in scenes] == [(5.005, 0.512), (37.5, 0.33)]
+    assert all(s.get("thumbnail") and s.get("clip") for s in scenes)
+    assert len(runs) == 1 and runs[0].count("-i") == 2  # one batched pass for both scenes
+
+
+def test_probe_harvest_parallel_upsert_skips_unchanged(media_root, monkeypatch):
+    videos = []
+    for i in range(5):
+        v = media_root / f"clip{i}.mp4"
+        v.write_bytes(b"0" * (100 + i))
+        videos.append(v)
+    probed: list[str] = []
+
+    def fake_probe(video):
+        probed.append(video.name)
+        n = int(video.stem[-1])
+        return {
+            "format": {"duration": str(10.0 + n), "bit_rate": "1000", "format_name": "mov,mp4"},
+            "streams": [{"codec_type": "video", "codec_name": "h264", "width": 640, "height": 360 + n}],
+        }
+
+    monkeypatch.setattr(app, "ffprobe_available", lambda: True)
+    monkeypatch.setattr(app, "_ffprobe_json", fake_probe)
+    monkeypatch.setenv("METADATA_SIDECARS", "0")
+    first = app.probe_harvest(videos, workers=3, batch_size=2)
+    assert first["probed"] == 5 and first["skipped"] == 0
+    assert not any(app.metadata_path(v).exists() for v in videos)
+    with db.session(read_only=True) as conn:
+        rows = conn.execute("SELECT rel_path, duration, height, size_bytes FROM video ORDER BY rel_path").fetchall()
+    assert [(r["rel_path"], r["duration"], r["height"], r["size_bytes"]) for r in rows] == [
+        (f"clip{i}.mp4", 10.0 + i, 360 + i, 100 + i) for i in range(5)
+    ]
+    assert app._metadata_summary_cached(videos[2])[0] == 12.0  # served from the DB without a sidecar
+    # metadata_single follows the same rules: skipped while mtime/size match, no sidecar when disabled
+    app.metadata_single(videos[3])
+    assert probed.count("clip3.mp4") == 1
+    app.metadata_single(videos[3], force=True)
+    assert probed.count("clip3.mp4") == 2 and not app.metadata_path(videos[3]).exists()
+    summary = json.loads(bytes(app.metadata_get(path="clip3.mp4", force=False, view=False).body))["data"]
+    assert summary["duration"] == 13.0 and summary["height"] == 363
+    assert probed.count("clip3.mp4") == 2
+
+    videos[1].write_bytes(b"1" * 500)
+    second = app.probe_harvest(videos, want_payloads=True)
+    assert second["probed"] == 1 and second["skipped"] == 4
+    assert probed.count("clip1.mp4") == 2 and len(second["payloads"]) == 5
+
+    # stub sidecars (ffprobe missing when they were written) are re-probed, never ingested
+    monkeypatch.setenv("METADATA_SIDECARS", "1")
+    stubbed = media_root / "clip9.mp4"
+    stubbed.write_bytes(b"9" * 50)
+    monkeypatch.setattr(app, "ffprobe_available", lambda: False)
+    assert app.probe_harvest([stubbed])["stubbed"] == 1
+    assert json.loads(app.metadata_path(stubbed).read_text())["stub"] is True
+    assert app.probe_harvest([stubbed], stubs=False)["ingested"] == 0
+    with db.session(read_only=True) as conn:
+        row = conn.execute("SELECT metadata_json FROM video WHERE rel_path = 'clip9.mp4'").fetchone()
+    assert row is None or row["metadata_json"] is None
+    monkeypatch.setattr(app, "ffprobe_available", lambda: True)
+    third = app.probe_harvest([stubbed])
+    assert third["probed"] == 1 and third["ingested"] == 0 and "clip9.mp4" in probed
+    with db.session(read_only=True) as conn:
+        assert conn.execute("SELECT duration FROM video WHERE rel_path = 'clip9.mp4'").fetchone()["duration"] == 19.0
+    assert "stub" not in json.loads(app.metadata_path(stubbed).read_text())
+
+
+def test_visual_index_incremental_topk_and_colour_query(media_root, job_state, monkeypatch):
+    from PIL import Image
+
+    monkeypatch.setattr(app, "ffmpeg_available", lambda: False)
+    colours = {"red1": (220, 20, 30), "red2": (200, 40, 40), "blue": (20, 40, 220), "green": (30, 200, 40)}
+    for name, rgb in colours.items():
+        v = media_root / f"{name}.mp4"
+        v.write_bytes(name.encode())
+        img = Image.new("RGB", (96, 54), rgb)
+        for x in range(0, 96, 12):
+            img.paste((255, 255, 255), (x, 0, x + 2, 54))
+        img.save(app.thumbnails_path(v))
+
+    jid = app._new_job("index-embeddings", str(media_root))
+    app._run_job_worker(jid, app.JobRequest(task="index-embeddings", directory=str(media_root), recursive=True))
+    result = app.JOBS[jid]["result"]
+    assert result["indexed"] == 4 and result["count"] == 4 and not result["failed"]
+    assert app._visual_index().matrix_path.stat().st_size == 4 * app.VISUAL_EMBED_DIM * 4
+
+    hits = app.api_search_by_file(file="red1.mp4", mode="color", top_k=2)["items"]
+    assert hits[0]["file"] == "red2.mp4" and all(h["file"] != "red1.mp4" for h in hits)
+    assert app.api_search_by_text(q="blue", mode="auto", top_k=1)["items"][0]["file"] == "blue.mp4"
+
+    (media_root / "green.mp4").unlink()
+    again = app._visual_index_sync(app._iter_videos(media_root, True), prune_under=media_root)
+    assert again == {**again, "indexed": 0, "skipped": 3, "removed": 1, "count": 3}
+    app._VISUAL_INDEX = None  # reload from disk
+    assert set(app._visual_index().rows) == {"red1.mp4", "red2.mp4", "blue.mp4"}
+
+
+def test_visual_ivf_incremental_insert_and_recall(tmp_path):
+    import numpy as np
+
+    rng = np.random.default_rng(1)
+    dim = app.VISUAL_EMBED_DIM
+    centers = rng.normal(size=(8, dim)).astype(np.float32)
+    idx = app._VisualIndex(tmp_path / "emb")
+    idx.upsert({f"v{i}.mp4": ("0:0", centers[i % 8] + 0.2 * rng.normal(size=dim).astype(np.float32)) for i in range(400)})
+    info = idx.train_ivf(16)
+    assert info["trained"] and info["nlist"] == 16 and int((idx.assign >= 0).sum()) == 400
+
+    probe = centers[3] + 0.2 * rng.normal(size=dim).astype(np.float32)
+    idx.upsert({"new.mp4": ("1:1", probe)})
+    reloaded = app._VisualIndex(tmp_path / "emb")
+    row = reloaded.rows["new.mp4"]
+    assert reloaded.assign[row] == int(np.argmax(reloaded.centroids @ probe))
+    exact = reloaded.query(probe, 5)
+    assert exact[0][0] == "new.mp4"
+    assert reloaded.query(probe, 5, nprobe=16) == exact  # probing every list is exact
+    assert reloaded.query(probe, 5, nprobe=2)[0][0] == "new.mp4"
+
+    reloaded.remove(["new.mp4"])
+    assert all(r != "new.mp4" for r, _s in reloaded.query(probe, 5, nprobe=4))
+    report = reloaded.benchmark(k=5, queries=40, nprobes=(1, 16))
+    assert report["ivf"][-1]["recall"] == 1.0 and 0.0 < report["ivf"][0]["recall"] <= 1.0
+
+
+def test_fallback_face_embeddings_decode_each_video_once(media_root, monkeypatch):
+    video = _write_video_with_sidecars(media_root, "faces.mp4", phash_hex="09", duration=30.0, width=64, height=36)
+    runs: list[list[str]] = []
+
+    def fake_frames(cmd, frame_bytes, *, cancel_check=None, frame_pts=False):
+        runs.append(cmd)
+        assert frame_pts and frame_bytes == 64 * 36 * 3
+        # frames arrive in time order; a frame between the requested times is skipped
+        for t, shade in ((2.0, 40), (3.5, 90), (7.0, 200)):
+            yield t, bytes([shade]) * frame_bytes
+
+    monkeypatch.setattr(app, "_iter_ffmpeg_raw_frames", fake_frames)
+    boxes = [(2.0, [0, 0, 16, 16]), (7.0, [8, 8, 16, 16]), (2.0, [16, 0, 16, 16]), (50.0, [0, 0, 8, 8])]
+    vecs = app._compute_fallback_embeddings_for_boxes(video, boxes)
+    assert len(runs) == 1 and runs[0][runs[0].index("-vf") + 1].count("between(t") == 3
+    assert [len(v) for v in vecs] == [64, 64, 64, 0]  # 50s was never decoded
+    assert app._compute_fallback_embedding_for_box(video, 7.0, [0, 0, 16, 16]) == vecs[1]
+
+
+def test_face_index_performers_and_videos_then_find(media_root, monkeypatch):
+    import numpy as np
+    from PIL import Image
+
+    # No OpenCV here: treat the whole (non-blank) image as the single face.
+    monkeypatch.setattr(app, "_face_detect", lambda gray, **_kw: [(0, 0, gray.shape[1], gray.shape[0])])
+    ramp = np.tile(np.linspace(0, 255, 64, dtype=np.uint8), (64, 1))
+    stripes = np.tile(((np.arange(64) // 4) % 2 * 255).astype(np.uint8)[:, None], (1, 64))
+    rng = np.random.default_rng(0)
+    (media_root / "people").mkdir()
+    Image.fromarray(ramp, "L").save(media_root / "people" / "alice.png")
+    Image.fromarray(stripes, "L").save(media_root / "people" / "bob.png")
+    app._save_registry(app._performers_registry_path(), {"performers": [
+        {"name": "Alice", "slug": "alice", "image": "people/alice.png"},
+        {"name": "Bob", "slug": "bob", "image": "people/bob.png"},
+    ]})
+    for name, tiles in {"a.mp4": [rng.integers(0, 255, (64, 64)), ramp], "b.mp4": [stripes, stripes.T]}.items():
+        v = media_root / name
+        v.write_bytes(b"x")
+        sheet, sheet_json = app.sprite_sheet_paths(v)
+        Image.fromarray(np.hstack(tiles).astype(np.uint8), "L").convert("RGB").save(sheet, format="JPEG", quality=98)
+        sheet_json.write_text(json.dumps({"cols": 2, "rows": 1, "tile_width": 64, "tile_height": 64, "interval": 5.0,
+                                          "frames": [{"i": 0, "t": 1.5}, {"i": 1, "t": 7.25}]}))
+
+    perf = app.face_index_performers()
+    assert perf["embedded"] == 2 and perf["updated"] == ["alice", "bob"]
+    registry = app._load_registry(app._performers_registry_path(), "performers")["performers"]
+    assert all(len(p["image_face_box"]) == 4 for p in registry)
+    vids = app.face_index_videos(app._iter_videos(media_root, True))
+    assert vids == {"videos": 2, "faces": 4, "errors": []}
+
+    hits = app.face_find(app._performer_face_vector("alice"), kind="video", top_k=2)
+    assert hits[0]["source"] == "a.mp4" and hits[0]["t"] == 7.25 and hits[0]["score"] > 0.99
+    assert len({h["source"] for h in hits}) == 2  # best hit per video
+    who = json.loads(bytes(app.api_faces_find(performer="bob", image=None, kind="performer", top_k=1, min_score=0.0).body))["data"]["items"]
+    assert who[0]["label"] == "Bob"
+    # Unchanged sources are skipped on the next run
+    assert app.face_index_performers()["images"] == 0
+    assert app.face_index_videos(app._iter_videos(media_root, True))["videos"] == 0
+
+
+def test_idle_planner_queries_missing_artifacts_newest_first(media_root):
+    from tools.idle_worker import IdleCapacity, IdlePlanner
+
+    now = int(time.time())
+    with db.session() as conn:
+        for i, rel in enumerate(["old.mp4", "sub/mid.mp4", "sub/new.mp4", "done.mp4"]):
+            conn.execute(
+                "INSERT INTO video (rel_path, mtime_ns, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (rel, (i + 1) * 10**9, now, now),
+            )
+        vid = conn.execute("SELECT id FROM video WHERE rel_path = 'done.mp4'").fetchone()["id"]
+        conn.execute(
+            "INSERT INTO artifact (media_id, type, path, status, created_at, updated_at) VALUES (?, 'thumbnail', 'x', 'present', ?, ?)",
+            (vid, now, now),
+        )
+    root = app.STATE["root"]
+    assert app._db_missing_artifacts(root, root, "thumbnail") == ["sub/new.mp4", "sub/mid.mp4", "old.mp4"]
+    assert app._db_missing_artifacts(root / "sub", root, "thumbnail", exclude=["sub/new.mp4"]) == ["sub/mid.mp4"]
+
+    calls: list[str] = []
+
+    def fetch(base, kind, limit, exclude):
+        calls.append(kind)
+        return app._db_missing_artifacts(base, root, kind, limit=limit, exclude=exclude)
+
+    planner = IdlePlanner(fetch_fn=fetch, refill=2)
+    # Cheapest kind first, one kind per batch, newest files first
+    assert planner.next_batches(root, ["preview", "thumbnail"], slots=2, batch_size=2) == [
+        ("thumbnail", ["sub/new.mp4", "sub/mid.mp4"]),
+        ("thumbnail", ["old.mp4"]),
+    ]
+    assert planner.next_batches(root, ["preview", "thumbnail"], slots=1, batch_size=10) == [
+        ("preview", ["done.mp4", "sub/new.mp4"]),
+    ]
+    # Submitted items are not handed out again while their jobs may still be running
+    assert planner.next_batches(root, ["thumbnail"], slots=4, batch_size=10) == []
+    assert calls.count("thumbnail") == 3
+
+    cap = IdleCapacity(batch_seconds=60, initial=4, max_batch=50)
+    assert cap.batch_size() == 4
+    cap.observe(4, 8.0)  # 2 s per item -> 30 items fill a minute
+    assert cap.batch_size() == 30
+    cap.observe(10, 1.0)
+    assert 30 < cap.batch_size() <= 50
+
+
+def test_ffmpeg_controller_lanes_threads_and_costs(monkeypatch):
+    monkeypatch.setattr(app, "_CPU_CT", 8)
+    monkeypatch.setattr(app, "_FFMPEG_CONCURRENCY", 2)
+    monkeypatch.delenv("FFMPEG_HEAVY_TYPES", raising=False)
+    ctl = app._FfmpegController()
+    assert ctl.classify("transcode") == "heavy"
+    assert ctl.classify("sprites-batch") == "light"
+
+    # The share is computed once the process counts as in flight: alone it gets every core
+    assert ctl.acquire("heavy") == 8
+    # Heavy work holds one slot; light keeps its own lane and gets a smaller -threads share
+    assert ctl.limits() == {"heavy": 1, "light": 1}
+    assert ctl.threads_for("heavy") > ctl.threads_for("light") >= 1
+    assert ctl.thread_load == 8
+
+    # Slow measured runs move a type into the heavy lane
+    for _ in range(3):
+        ctl.inflight["light"] += 1
+        ctl.release("light", "sprites", 45.0)
+    assert ctl.classify("sprites") == "heavy"
+    ctl.release("heavy", "transcode", 1.0, 8)
+
+    snap = ctl.snapshot()
+    assert snap["inflight"] == {"heavy": 0, "light": 0} and snap["threadLoad"] == 0
+    assert snap["costSeconds"]["sprites"] == 45.0
+
+    # A saturated host is not pressure when our own in-flight ffmpeg threads account for it
+    ticks = iter(range(1, 100))
+    monkeypatch.setattr(app, "_read_cpu_times", lambda: (next(ticks) * 1000, next(ticks) * 1000 + 1))
+    monkeypatch.setattr(app, "_read_mem_available_frac", lambda: 0.5)
+    monkeypatch.setattr(app.os, "getloadavg", lambda: (9.0, 9.0, 9.0))
+    busy = app._FfmpegController()
+    busy.slots, busy.thread_load = 2, 8
+    with busy.cond:
+        busy._refresh(10.0)
+        busy._refresh(20.0)
+        assert busy.slots == 2 and busy.sample["own"] == 1.0
+        busy.thread_load = 0
+        busy._refresh(30.0)
+    assert busy.slots == 1 and busy.last_decision["reason"] == "pressure"
+
+    # -threads stays off unless opted in; the adaptive share is added after the slot is held
+    monkeypatch.delenv("FFMPEG_THREADS", raising=False)
+    assert app._ffmpeg_threads_flags() == []
+    monkeypatch.setattr(app, "_FFMPEG_CTL", app._FfmpegController())
+    ran: list[list[str]] = []
+    monkeypatch.setattr(app, "_run_inner", lambda cmd: ran.append(cmd))
+    app._run(["ffmpeg", "-i", "in.mp4", "out.mp4"])
+    monkeypatch.setenv("FFMPEG_THREADS", "adaptive")
+    assert app._ffmpeg_threads_flags() == []
+    app._run(["ffmpeg", "-i", "in.mp4", "out.mp4"])
+    assert ran == [["ffmpeg", "-i", "in.mp4", "out.mp4"], ["ffmpeg", "-i", "in.mp4", "-threads", "8", "out.mp4"]]
+    assert app._FFMPEG_CTL.thread_load == 0
+
+    # Direct spawn sites hold the same slot; queueing on the process cap is not billed as cost
+    sem = threading.BoundedSemaphore(1)
+    sem.acquire()
+    monkeypatch.setattr(app, "_FFMPEG_SEM", sem)
+    threading.Timer(0.3, sem.release).start()
+    with app._FFMPEG_CTL.slot("transcode", threads=None) as threads:
+        assert threads == 8 and app._FFMPEG_CTL.inflight["heavy"] == 1
+    assert app._FFMPEG_CTL.cost["transcode"] < 0.2
+    assert app._FFMPEG_CTL.inflight["heavy"] == 0 and sem.acquire(blocking=False)
+
+    monkeypatch.setenv("FFMPEG_ADAPTIVE", "0")
+    assert app._ffmpeg_threads_flags() == []
+
+
+def test_job_slots_prefer_interactive_and_weight_batch_over_idle(monkeypatch):
+    monkeypatch.delenv("JOB_CLASS_WEIGHTS", raising=False)
+    monkeypatch.setenv("JOB_INTERACTIVE_RESERVED", "1")
+    slots = app._JobSlots(2)
+    assert slots.acquire(cls="batch")
+    # The second slot is reserved for interactive work
+    assert slots.acquire(blocking=False, cls="batch") is False
+
+    order: list[str] = []
+
+    def worker(cls: str):
+        slots.acquire(cls=cls)
+        order.append(cls)
+        slots.release()
+
+    threads = [threading.Thread(target=worker, args=(c,)) for c in ("idle", "batch", "batch", "batch", "idle")]
+    for t in threads:
+        t.start()
+        time.sleep(0.02)
+    inter = threading.Thread(target=worker, args=("interactive",))
+    inter.start()
+    inter.join(timeout=2)
+    assert order == ["interactive"]
+
+    slots.release()
+    for t in threads:
+        t.join(timeout=2)
+    # Weighted 3:1 once the reserved slot is free again
+    assert order[1:] == ["batch", "batch", "batch", "idle", "idle"]
+    snap = slots.snapshot()
+    assert snap["classes"]["idle"]["queueWait"]["count"] == 2
+    assert snap["classes"]["batch"]["running"] == 0
+
+    # A fan-out holder takes several slots, capped at what its class can be granted
+    wide = app._JobSlots(4)
+    assert wide.acquire(cls="batch", weight=8)
+    assert wide.snapshot()["classes"]["batch"]["running"] == 3
+    assert wide.acquire(blocking=False, cls="batch") is False
+    assert wide.acquire(blocking=False, cls="interactive")
+    wide.release()
+    wide.release()
+    assert wide.snapshot()["classes"]["batch"]["running"] == 0
+
+
+def test_batch_job_drains_persisted_items_with_retries(media_root, job_state, monkeypatch):
+    rels = [f"b{i}.mp4" for i in range(5)]
+    for rel in rels:
+        (media_root / rel).write_bytes(b"\x00" * 64)
+    calls: dict[str, int] = {}
+
+    def fake_item(v, prm, force, cancel_check):
+        calls[v.name] = calls.get(v.name, 0) + 1
+        if v.name == "b1.mp4" and calls[v.name] == 1:
+            raise RuntimeError("transient")
+        if v.name == "b3.mp4":
+            raise RuntimeError("broken")
+
+    monkeypatch.setitem(app._BATCH_ITEM_TASKS, "phash", fake_item)
+    monkeypatch.setenv("BATCH_ITEM_ATTEMPTS", "2")
+    jid = app._create_batch_job("phash", media_root, rels, {"frames": 3}, force=False)
+    assert app._is_target_active("phash", "b0.mp4")
+
+    deadline = time.time() + 10
+    while app.JOBS[jid]["state"] not in ("done", "failed") and time.time() < deadline:
+        time.sleep(0.05)
+    job = app.JOBS[jid]
+    assert job["state"] == "done"
+    assert job["items"] == {"queued": 0, "running": 0, "done": 4, "failed": 1}
+    assert job["result"]["failed_paths"] == ["b3.mp4"]
+    assert calls["b1.mp4"] == 2 and calls["b3.mp4"] == 2
+
+    page = app.job_items(jid, state="failed")
+    assert page["counts"] == {"done": 4, "failed": 1}
+    assert page["items"][0]["target"] == "b3.mp4" and page["items"][0]["attempts"] == 2
+    # Finished jobs leave nothing in the dedup index
+    assert not any(app._is_target_active("phash", r) for r in rels)
+
+    # Targets already covered by a queued/running job are skipped in every mode, not only "missing"
+    from starlette.testclient import TestClient
+
+    created: list[tuple[list[str], int]] = []
+    monkeypatch.setattr(app, "_create_batch_job", lambda task, base, targets, params, *, force: created.append((list(targets), force)) or "jid")
+    app._active_targets_add("other", "phash", ["b0.mp4", "b2.mp4"])
+    resp = TestClient(app.app).post("/api/tasks/batch", json={"operation": "phash", "mode": "all", "fileSelection": "all"})
+    assert resp.status_code == 200
+    assert created == [(["b1.mp4", "b3.mp4", "b4.mp4"], True)]
+    app._active_targets_release("other")
+
+
+def test_artifacts_cli_process_mode_checkpoints_and_resumes(media_root, monkeypatch, capsys):
+    import signal
+
+    # Worker processes inherit the environment: point them at this root and state dir, and
+    # let main() mutate the env only through keys monkeypatch will restore.
+    for key, val in {
+        "MP_VENV_BOOTSTRAPPED": "1",
+        "MEDIA_ROOT": str(media_root),
+        "MEDIA_PLAYER_STATE_DIR": str(media_root / ".state"),
+        "FFPROBE_DISABLE": "1",
+        "FFMPEG_TIMELIMIT": "600",
+        "FFMPEG_LOGLEVEL": "error",
+    }.items():
+        monkeypatch.setenv(key, val)
+    from tools import artifacts as cli
+
+    videos = []
+    for i in range(4):
+        v = media_root / f"cli{i}.mp4"
+        v.write_bytes(b"\x00" * (64 + i))
+        videos.append(v)
+    ck = media_root / "run.checkpoint.jsonl"
+    # --no-ffprobe turns the metadata step into the stub generator, so no ffmpeg is needed
+    argv = ["--root", str(media_root), "--what", "metadata", "--no-ffprobe", "--workers-mode", "process",
+            "--concurrency", "2", "--checkpoint", str(ck)]
+    old_sigint = signal.getsignal(signal.SIGINT)
+    try:
+        assert cli.main(argv) == 0
+        lines = ck.read_text().splitlines()
+        assert sorted(json.loads(line)["path"] for line in lines) == sorted(str(v) for v in videos)
+        assert all(app.metadata_path(v).exists() for v in videos)
+
+        # Interrupted run: two steps made it to disk, the third was torn mid-write
+        done = sorted(lines)[:2]
+        ck.write_text("\n".join(done) + "\n" + sorted(lines)[2][:20])
+        reloaded = cli.Checkpoint(ck, resume=True)
+        reloaded.close()
+        resumed = {Path(json.loads(line)["path"]) for line in done}
+        assert all(reloaded.done_steps(v) == ({"metadata"} if v in resumed else set()) for v in videos)
+        for v in videos:
+            app.metadata_path(v).write_text("untouched")
+
+        capsys.readouterr()
+        assert cli.main([*argv, "--resume", "--recompute-all", "--force"]) == 0
+        out = capsys.readouterr().out
+    finally:
+        signal.signal(signal.SIGINT, old_sigint)
+    assert out.count("metadata (resume)") == 2
+    for v in videos:
+        text = app.metadata_path(v).read_text()
+        assert (text == "untouched") == (v in resumed)
+    # The resumed run appended the rest after the torn line, and everything reloads as done
+    final = cli.Checkpoint(ck, resume=True)
+    final.close()
+    assert all(final.done_steps(v) == {"metadata"} for v in videos)
+    assert len([line for line in ck.read_text().splitlines() if line.startswith('{"path"') and line.endswith("}")]) == 4
+
+
+def test_db_backup_streams_ndjson_and_hot_copy(media_root, tmp_path):
+    from tools import db_backup
+
+    with db.session() as conn:
+        conn.executemany(
+            "INSERT INTO video (rel_path, mtime_ns, created_at, updated_at) VALUES (?, ?, 1, 1)",
+            [(f"v{i}.mp4", i) for i in range(2500)],
+        )
+    out = tmp_path / "backup.ndjson.gz"
+    assert db_backup.main(["dump", "-o", str(out)]) == 0
+    copy = tmp_path / "hot.db"
+    assert db_backup.main(["dump", "-o", str(copy)]) == 0
+
+    other = tmp_path / "restore" / "media-player.db"
+    db.configure(other)
+    db.ensure_schema()
+    assert db_backup.main(["load", "-i", str(out)]) == 0
+    with db.session(read_only=True) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM video").fetchone()[0] == 2500
+    # Existing rows are protected unless --replace is given
+    assert db_backup.main(["load", "-i", str(out)]) == 1
+    assert db_backup.main(["load", "-i", str(copy), "--replace"]) == 0
+    with db.session(read_only=True) as conn:
+        assert conn.execute("SELECT MAX(rel_path) FROM video").fetchone()[0] == "v999.mp4"
+    # Streamed restores run in one transaction unless batching is requested
+    assert db_backup._build_parser().parse_args(["load", "-i", str(out)]).commit_every is None
+    assert db_backup.main(["load", "-i", str(out), "--replace", "--commit-every", "1000"]) == 0
+    with db.session(read_only=True) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM video").fetchone()[0] == 2500
+
+    # A truncated --replace restore rolls back instead of leaving a wiped database
+    import gzip
+
+    raw = gzip.decompress(out.read_bytes())
+    no_end = tmp_path / "no-end.ndjson.gz"
+    no_end.write_bytes(gzip.compress(raw[: raw.rstrip().rfind(b"\n") + 1]))
+    cut = tmp_path / "cut.ndjson.gz"
+    cut.write_bytes(out.read_bytes()[: out.stat().st_size // 2])
+    with db.session() as conn:
+        conn.execute("DELETE FROM video WHERE rel_path = 'v0.mp4'")
+    for bad in (no_end, cut):
+        assert db_backup.main(["load", "-i", str(bad), "--replace"]) == 1
+        with db.session(read_only=True) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM video").fetchone()[0] == 2499
+
+
+def test_migrate_media_attr_bulk_merge_skips_unchanged_rows(media_root):
+    from tools import migrate_media_attr as migrate
+
+    migrate.DB = db
+    attr = {f"m{i}.mp4": {"tags": ["Drama", f"t{i % 3}"], "performers": [f"P{i % 4}"]} for i in range(30)}
+    meta = {"m0.mp4": {"description": "first", "rating": 4, "favorite": True}}
+    dry = migrate.bulk_import(attr, meta, apply=False)
+    assert len(dry["media_attr"]["missing_in_db"]) == 30
+
+    first = migrate.bulk_import(attr, meta, apply=True)
+    assert first["apply_stats"]["media_attr_rows"] == 30
+    assert not first["media_attr"]["diffs"] and not first["metadata"]["diffs"]
+    assert first["media_attr"]["sidecar_digest"] == first["media_attr"]["db_digest"]
+
+    attr["m1.mp4"] = {"tags": ["drama"], "performers": []}
+    again = migrate.bulk_import(attr, meta, apply=True)
+    assert again["apply_stats"] == {"media_attr_rows": 1, "metadata_rows": 0, "unchanged_rows": 29}
+    db_attr, _ = migrate.fetch_db_media_attr(["m0.mp4", "m1.mp4"])
+    assert db_attr["m1.mp4"] == {"tags": ["drama"], "performers": []}
+    db_meta, _ = migrate.fetch_db_metadata(["m0.mp4"])
+    assert db_meta["m0.mp4"] == {"description": "first", "rating": 4, "favorite": True}
+
+    meta["m0.mp4"]["rating"] = 5
+    third = migrate.bulk_import(attr, meta, apply=True)
+    assert third["apply_stats"] == {"media_attr_rows": 0, "metadata_rows": 1, "unchanged_rows": 29}
+
+
+def test_directory_scope_uses_closure_and_rollups(media_root):
+    (media_root / "a" / "b").mkdir(parents=True)
+    (media_root / "a_b").mkdir()
+    with db.session() as conn:
+        for rel in ("top.mp4", "a/1.mp4", "a/b/2.mp4", "a_b/3.mp4"):
+            app._db_ensure_video(conn, rel)
+        # Rows written outside the app helpers are backfilled on the next scoped read
+        conn.execute("INSERT INTO video (rel_path, mtime_ns, created_at, updated_at) VALUES ('a/b/c/4.mp4', 0, 1, 1)")
+        vid = conn.execute("SELECT id FROM video WHERE rel_path = 'a/b/2.mp4'").fetchone()[0]
+        conn.execute(
+            "INSERT INTO artifact (media_id, type, path, status, created_at, updated_at) VALUES (?, 'thumbnail', 'x', 'present', 1, 1)",
+            (vid,),
+        )
+
+    coverage, total = app._compute_db_coverage(media_root / "a", media_root)
+    assert total == 3 and coverage["thumbnails"]["processed"] == 1
+    counts, direct = app._db_artifact_counts(media_root / "a" / "b", media_root, recursive=False)
+    assert direct == 1 and counts["thumbnails"] == 1
+    assert app._db_artifact_counts(media_root, media_root, recursive=False)[1] == 1
+
+    with db.session() as conn:
+        conn.execute("DELETE FROM video WHERE id = ?", (vid,))
+    coverage, total = app._compute_db_coverage(media_root / "a", media_root)
+    assert total == 2 and coverage["thumbnails"]["processed"] == 0
+
+
+def test_scope_stats_read_from_directory_rollups(media_root):
+    (media_root / "s" / "t").mkdir(parents=True)
+    with db.session() as conn:
+        for rel, size, duration, height in (
+            ("s/a.mp4", 100, 30.0, 1080),
+            ("s/t/b.mp4", 200, 400.0, 2160),
+            ("root.mp4", 50, None, None),
+        ):
+            vid = app._db_ensure_video(conn, rel)
+            conn.execute(
+                "UPDATE video SET size_bytes = ?, duration = ?, height = ? WHERE id = ?",
+                (size, duration, height, vid),
+            )
+
+    stats = app._db_scope_stats(media_root / "s", media_root, recursive=True)
+    assert stats["num_files"] == 2 and stats["total_size"] == 300
+    assert stats["res_buckets"]["1080"] == 1 and stats["res_buckets"]["2160"] == 1
+    assert stats["duration_buckets"]["<1m"] == 1 and stats["duration_buckets"]["5-20m"] == 1
+    direct = app._db_scope_stats(media_root / "s", media_root, recursive=False)
+    assert direct["num_files"] == 1 and direct["total_duration"] == 30.0
+    library = app._db_scope_stats(media_root, media_root, recursive=True)
+    assert library["num_files"] == 3 and library["res_buckets"]["other"] == 1
+
+    with db.session() as conn:
+        conn.execute("UPDATE video SET height = 720 WHERE rel_path = 's/t/b.mp4'")
+        before = sorted(tuple(r) for r in conn.execute("SELECT * FROM directory_rollup WHERE tree <> 0"))
+        app._db_rebuild_directory_rollups(conn)
+        assert sorted(tuple(r) for r in conn.execute("SELECT * FROM directory_rollup")) == before
+    assert app._db_scope_stats(media_root, media_root, recursive=True)["res_buckets"]["720"] == 1
+
+
+def test_duplicate_resolution_merges_into_keeper_and_undoes(media_root, monkeypatch):
+    hi = _write_video_with_sidecars(media_root, "hi.mp4", phash_hex="05", duration=60.0)
+    lo = _write_video_with_sidecars(media_root, "dup/lo.mp4", phash_hex="05", duration=60.0)
+    app.scenes_json_path(lo).write_text(json.dumps({"scenes": [
+        {"time": 12.0, "type": "scene", "label": "Chorus", "scene": True, "intro": True},
+    ]}))
+    _set_media_attr_entry(hi, tags=["Keep"])
+    _set_media_attr_entry(lo, tags=["Solo"], performers=["Ann"])
+    with db.session() as conn:
+        for rel, width, height, rating in (("hi.mp4", 1920, 1080, None), ("dup/lo.mp4", 1280, 720, 4)):
+            conn.execute(
+                "UPDATE video SET width = ?, height = ?, rating = ? WHERE rel_path = ?",
+                (width, height, rating, rel),
+            )
+
+    plans = app.plan_duplicate_resolution([[str(lo), "hi.mp4"]])
+    assert [(p["keeper"], p["losers"]) for p in plans] == [("hi.mp4", ["dup/lo.mp4"])]
+
+    result = app.apply_duplicate_resolution(plans, action="trash")
+    assert result["removed"] == 1 and result["markers_merged"] == 1
+    assert not lo.exists() and not (media_root / ".artifacts" / "scenes" / "lo").exists()
+    assert (media_root / ".artifacts" / "dedupe" / result["op"] / "files" / "dup" / "lo.mp4").is_file()
+    assert app._current_media_lists("hi.mp4") == (["Keep", "Solo"], ["Ann"])
+    assert "dup/lo.mp4" not in app._MEDIA_ATTR
+    with db.session(read_only=True) as conn:
+        assert conn.execute("SELECT rating FROM video WHERE rel_path = 'hi.mp4'").fetchone()[0] == 4
+        assert conn.execute("SELECT COUNT(*) FROM video WHERE rel_path = 'dup/lo.mp4'").fetchone()[0] == 0
+    merged = json.loads(app.scenes_json_path(hi).read_text())["scenes"]
+    assert [(m["time"], m["label"], m.get("intro")) for m in merged] == [(12.0, "Chorus", True)]
+
+    undone = app.undo_duplicate_resolution(result["op"])
+    assert undone["restored"] == ["dup/lo.mp4"] and lo.is_file()
+    assert app.scenes_json_path(lo).is_file() and not app.scenes_json_path(hi).exists()
+    lo_markers = json.loads(bytes(app.list_markers(path="dup/lo.mp4").body))["data"]["markers"]
+    assert [m["time"] for m in lo_markers] == [12.0]
+    assert app._current_media_lists("hi.mp4") == (["Keep"], [])
+    assert app._current_media_lists("dup/lo.mp4") == (["Solo"], ["Ann"])
+    with db.session(read_only=True) as conn:
+        assert conn.execute("SELECT height FROM video WHERE rel_path = 'dup/lo.mp4'").fetchone()[0] == 720
+
+    # Killed after staging the files: the ledger written before the first move undoes it
+    class Killed(BaseException):
+        pass
+
+    def killed(*args, **kwargs):
+        raise Killed()
+
+    monkeypatch.setattr(app, "_dedupe_fetch_names", killed)
+    try:
+        app.apply_duplicate_resolution(plans, action="trash")
+    except Killed:
+        pass
+    assert not lo.exists()
+    ops = [d for d in (media_root / ".artifacts" / "dedupe").iterdir() if d.name != result["op"]]
+    ledger = json.loads((ops[0] / "ledger.json").read_text())
+    assert ledger["status"] == "staging" and [m["path"] for m in ledger["moves"]] == ["dup/lo.mp4"]
+    assert app.undo_duplicate_resolution(ops[0].name)["restored"] == ["dup/lo.mp4"] and lo.is_file()
+
+
+def test_markers_live_in_sqlite_with_cross_library_queries(media_root):
+    def data(resp):
+        return json.loads(bytes(resp.body))["data"]
+
+    def set_marker(path, time, label=None, **flags):
+        opts = {"special": None, "name": None, "scene": None, "intro": None, "outro": None, **flags}
+        return app.set_marker(path=path, time=time, type="scene", label=label, **opts)
+
+    def adjacent(path, time, direction):
+        return data(app.markers_adjacent(path=path, time=time, direction=direction, type=None))["marker"]
+
+    def search(**kw):
+        opts = {"label": None, "type": None, "flag": None, "directory": "", "recursive": True, "limit": 10, "offset": 0, **kw}
+        return data(app.markers_search(**opts))
+
+    a = _write_video_with_sidecars(media_root, "show/a.mp4", phash_hex="01")
+    b = _write_video_with_sidecars(media_root, "b.mp4", phash_hex="02")
+    # Legacy sidecar markers of indexed videos are imported before cross-library queries
+    app.scenes_json_path(b).write_text(json.dumps({"scenes": [{"time": 3.0, "type": "scene", "label": "Opening"}], "outro": 50.0}))
+    with db.session() as conn:
+        app._db_ensure_video(conn, "b.mp4")
+
+    set_marker("show/a.mp4", 5.0, "Opening", special="intro")
+    set_marker("show/a.mp4", 20.0, "Fight")
+    set_marker("show/a.mp4", 30.0, intro=True)
+    listed = data(app.list_markers(path="show/a.mp4"))
+    assert [(m["time"], m["intro"]) for m in listed["markers"]] == [(5.0, False), (20.0, False), (30.0, True)]
+    assert listed["intro"] == 30.0
+    mirror = json.loads(app.scenes_json_path(a).read_text())
+    assert mirror["intro"] == 30.0 and len(mirror["scenes"]) == 3
+
+    updated = app.update_marker(
+        path="show/a.mp4", old_time=20.0, new_time=22.5, type="scene", label="Duel",
+        special=None, name=None, scene=None, intro=None, outro=None,
+    )
+    assert data(updated)["saved"]
+    assert data(app.delete_marker(path="show/a.mp4", time=99.0, type="scene", special=None))["deleted"] is False
+    assert data(app.delete_marker(path="show/a.mp4", time=30.0, type="scene", special=None))["count"] == 2
+
+    nxt = adjacent("show/a.mp4", 5.0, "next")
+    assert nxt["time"] == 22.5 and nxt["label"] == "Duel"
+    assert adjacent("show/a.mp4", 22.5, "prev")["time"] == 5.0
+    assert adjacent("show/a.mp4", 22.5, "next") is None
+
+    opening = search(label="opening")
+    assert [(m["video"], m["time"]) for m in opening["markers"]] == [("b.mp4", 3.0), ("show/a.mp4", 5.0)]
+    outros = search(flag="outro")
+    assert [(m["video"], m["time"], m.get("point")) for m in outros["markers"]] == [("b.mp4", 50.0, True)]
+    assert search(label="opening", directory="show")["total"] == 1
+
+    # Re-detection replaces only detected markers; manual ones survive and are mirrored
+    app._db_store_detected_markers(a, [{"time": 1.0, "scene": True, "name": "1", "score": 0.5, "thumbnail": "t1.jpg"}])
+    app._db_store_detected_markers(a, [{"time": 2.0, "scene": True, "name": "1"}])
+    times = [m["time"] for m in data(app.list_markers(path="show/a.mp4"))["markers"]]
+    assert times == [2.0, 5.0, 22.5]
+    assert [s["time"] for s in json.loads(app.scenes_json_path(a).read_text())["scenes"]] == [2.0, 5.0, 22.5]
+
+
+def test_compare_sampled_aligns_by_duration_and_caches_pairs(media_root, monkeypatch):
+    import numpy as np
+    va = _write_video_with_sidecars(media_root, "keep.mp4", phash_hex="05", duration=100.0, width=320, height=180)
+    vb = _write_video_with_sidecars(media_root, "copy.mp4", phash_hex="05", duration=50.0, width=640, height=360)
+    rng = np.random.default_rng(7)
+    base = rng.integers(0, 256, size=(4, 144, 256), dtype=np.uint8)
+    calls: list[tuple[str, list[float]]] = []
+
+    def fake_frames_at(video, times, *, size, cancel_check=None):
+        assert size == (256, 144)
+        calls.append((video.name, list(times)))
+        for i in range(len(times)):
+            frame = base[i] if video.name == "keep.mp4" else (base[i] // 2) * 2
+            yield frame.tobytes()
+
+    monkeypatch.setattr(app, "_iter_gray_frames_at", fake_frames_at)
+    monkeypatch.setattr(app, "_COMPARE_CACHE", {})
+    first = app.compare_sampled(va, vb, frames=4)
+    assert calls[0] == ("keep.mp4", [12.5, 37.5, 62.5, 87.5])
+    assert calls[1] == ("copy.mp4", [6.25, 18.75, 31.25, 43.75])
+    assert first["frames"] == 4 and not first["cached"]
+    assert 0.9 < first["ssim"]["mean"] < 1.0 and first["psnr"]["mean"] > 40
+    assert first["histogram"]["mean"] < 0.2
+
+    same = app._compare_frame_metrics([f.tobytes() for f in base], [f.tobytes() for f in base], (256, 144))
+    assert same["ssim"]["min"] == 1.0 and same["psnr"]["min"] == 100.0 and same["histogram"]["mean"] == 0.0
+
+    again = app.compare_sampled(va, vb, frames=4)
+    assert again["cached"] and len(calls) == 2
+    app.compare_sampled(vb, va, frames=4)
+    assert len(calls) == 4  # ordered pairs are cached separately
+
+
+def test_listing_etags_and_negotiated_compression(media_root, job_state, monkeypatch):
+    import gzip
+    from starlette.testclient import TestClient
+
+    if app._orjson is not None:
+        rendered = json.loads(bytes(app.api_success({"score": float("nan"), 3: "x"}).body))
+        assert rendered["data"] == {"score": None, "3": "x"}
+
+    client = TestClient(app.app)
+    first = client.get("/api/tasks/jobs")
+    etag = first.headers["etag"]
+    assert first.status_code == 200 and etag.startswith('W/"')
+    cached = client.get("/api/tasks/jobs", headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and cached.content == b"" and cached.headers["etag"] == etag
+
+    # Job events and DB commits both move the key
+    app._publish_job_event({"event": "progress", "id": "x"})
+    assert client.get("/api/tasks/jobs", headers={"If-None-Match": etag}).status_code == 200
+    etag = client.get("/api/tasks/jobs").headers["etag"]
+    with db.session() as conn:
+        conn.execute("INSERT INTO tag(name, norm, created_at) VALUES ('t', 't', 0)")
+    assert client.get("/api/tasks/jobs", headers={"If-None-Match": etag}).status_code == 200
+
+    (media_root / "a.mp4").write_bytes(b"0")
+    etag = client.get("/api/library").headers["etag"]
+    (media_root / "b.mp4").write_bytes(b"0")
+    assert client.get("/api/library", headers={"If-None-Match": etag}).status_code == 200
+
+    # Progress ticks leave the library tag alone; state transitions and out-of-process
+    # artifact writes (the CLI touches the generation marker) move it
+    etag = client.get("/api/library").headers["etag"]
+    app._publish_job_event({"event": "progress", "id": "x"})
+    assert client.get("/api/library", headers={"If-None-Match": etag}).status_code == 304
+    app._publish_job_event({"event": "finished", "id": "x"})
+    assert client.get("/api/library", headers={"If-None-Match": etag}).status_code == 200
+    etag = client.get("/api/library").headers["etag"]
+    app._touch_artifacts_generation()
+    assert client.get("/api/library", headers={"If-None-Match": etag}).status_code == 200
+
+    monkeypatch.setattr(app, "_API_COMPRESS_MIN_BYTES", 64)
+    monkeypatch.setattr(app, "_brotli", None)
+    plain = client.get("/api/library", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    with client.stream("GET", "/api/library", headers={"Accept-Encoding": "br, gzip;q=0.5"}) as resp:
+        body = b"".join(resp.iter_raw())
+        assert resp.headers["content-encoding"] == "gzip" and "Accept-Encoding" in resp.headers["vary"]
+    assert json.loads(gzip.decompress(body)) == plain.json()
+    assert app._negotiate_encoding("gzip;q=0, deflate") is None
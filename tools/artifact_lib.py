@@ -0,0 +1,67 @@
+"""
+Lightweight entry point for generating artifacts outside the server.
+
+Importing this module is free: the first generator/helper lookup imports app.py in
+headless mode (MEDIA_PLAYER_HEADLESS=1), which keeps every generator but skips the
+FastAPI route registration that dominates cold start. Use it from CLI tools and
+scripts instead of `import app`:
+
+    from tools import artifact_lib as gen
+    gen.generate_thumbnail(video, force=True)
+"""
+
+from __future__ import annotations
+
+import importlib
+import os
+import sys
+from pathlib import Path
+from typing import Any
+
+# Names forwarded lazily to app; kept explicit so typos fail loudly.
+GENERATORS = (
+    "metadata_single",
+    "probe_harvest",
+    "generate_thumbnail",
+    "generate_thumbnails_batch",
+    "generate_preview",
+    "generate_sprite_sheet",
+    "generate_scene_artifacts",
+    "compute_heatmap",
+    "generate_waveform",
+    "generate_motion_activity",
+    "phash_create_single",
+)
+HELPERS = (
+    "artifact_dir",
+    "metadata_path",
+    "thumbnails_path",
+    "phash_path",
+    "scenes_json_path",
+    "sprite_sheet_paths",
+    "heatmap_json_path",
+    "preview_webm_path",
+    "preview_mp4_path",
+    "_sprite_defaults",
+    "_is_original_media_file",
+)
+
+__all__ = ["load_app", *GENERATORS, *HELPERS]
+
+
+def load_app():
+    """Import app once (headless unless it is already loaded) and return the module."""
+    mod = sys.modules.get("app")
+    if mod is not None:
+        return mod
+    root = str(Path(__file__).resolve().parents[1])
+    if root not in sys.path:
+        sys.path.insert(0, root)
+    os.environ.setdefault("MEDIA_PLAYER_HEADLESS", "1")
+    return importlib.import_module("app")
+
+
+def __getattr__(name: str) -> Any:
+    if name in GENERATORS or name in HELPERS:
+        return getattr(load_app(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
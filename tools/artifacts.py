@@ -16,19 +16,27 @@ Usage:
         --root /path/to/videos \
     [--recursive] \
     [--what all|thumb|preview|sprites|scenes|heatmap|phash|metadata] \
-    [--force] [--concurrency 2]
+    [--force] [--concurrency 2] \
+    [--workers-mode thread|process] [--resume]
 
 Notes:
 - Respects MEDIA_ROOT if set; --root overrides.
 - Uses the same media extension list as the server (see MEDIA_EXTS env or /config media_exts).
 - Requires ffmpeg/ffprobe for full fidelity, otherwise writes stubs where supported.
+- --workers-mode process runs one app instance per worker process (initialised once),
+  so CPU-side work (PIL hashing, sprite assembly) is not serialised by the GIL.
+- Completed steps are appended to a checkpoint file; --resume skips steps already
+  recorded for files whose size/mtime are unchanged.
 """
 
 from __future__ import annotations
 
 import argparse
 import concurrent.futures as cf
+import json
+import multiprocessing as mp
 import os
+import queue
 import sys
 import signal
 import threading
@@ -105,7 +113,8 @@ def import_app_module():
 
     When running this script as `python artifacts.py`,
     Python sets sys.path[0] to the scripts directory, so we need to add
-    the project root to sys.path to import `app`.
+    the project root to sys.path to import `app`. The import goes through
+    tools.artifact_lib so the server's route table is not built.
     """
     try:
         # Ensure project root (parent of this file's directory) is on sys.path
@@ -115,8 +124,8 @@ def import_app_module():
             sys.path.insert(0, sroot)
     except Exception:
         pass
-    mod = importlib.import_module("app")
-    return mod
+    artifact_lib = importlib.import_module("tools.artifact_lib")
+    return artifact_lib.load_app()
 
 
 def find_videos(m, base: Path, recursive: bool) -> list[Path]:
@@ -180,6 +189,280 @@ def task_metadata(m, v: Path, force: bool):
     m.metadata_single(v, force=force)
 
 
+STEP_ORDER = ["metadata", "thumb", "preview", "sprites", "scenes", "heatmap", "phash"]
+
+
+def steps_for(what: str) -> list[str]:
+    return list(STEP_ORDER) if what == "all" else [what]
+
+
+def artifact_exists(m, task: str, v: Path, preview_fmt: str = "webm") -> bool:
+    try:
+        if task == "metadata":
+            # with METADATA_SIDECARS=0 the probe only lands in the video table
+            return m.metadata_path(v).exists() or m._metadata_from_db(v) is not None
+        if task == "thumb":
+            return m.thumbnails_path(v).exists()
+        if task == "preview":
+            p = (m.artifact_dir(v) / f"{v.stem}.preview.{preview_fmt}")
+            try:
+                return p.exists() and p.stat().st_size > 0
+            except Exception:
+                return p.exists()
+        if task == "sprites":
+            try:
+                sheet, jpath = m.sprite_sheet_paths(v)
+                return sheet.exists() and jpath.exists()
+            except Exception:
+                return False
+        if task == "scenes":
+            try:
+                # Prefer strict server helper when available
+                return bool(getattr(m, "scenes_json_exists")(v))  # type: ignore[misc]
+            except Exception:
+                return m.scenes_json_path(v).exists()
+        if task == "heatmap":
+            try:
+                return bool(getattr(m, "heatmap_json_exists")(v))  # type: ignore[misc]
+            except Exception:
+                return m.heatmap_json_path(v).exists()
+        if task == "phash":
+            return m.phash_path(v).exists()
+    except Exception:
+        return False
+    return False
+
+
+def run_step(m, task: str, v: Path, opts: dict, progress=None, cancel=None) -> None:
+    """Run a single artifact step for one video with the CLI's defaults."""
+    if task == "metadata":
+        task_metadata(m, v, bool(opts.get("force")))
+    elif task == "thumb":
+        task_thumb(m, v, bool(opts.get("force")))
+    elif task == "preview":
+        fmt = str(opts.get("preview_fmt") or "webm")
+        try:
+            task_preview(m, v, progress=progress, cancel=cancel, fmt=fmt)
+        except Exception as e:
+            # If webm fails, retry once with mp4 as a fallback
+            if fmt != "webm":
+                raise
+            try:
+                sys.stderr.write(f"[cli] {v.name}: webm failed ({e}); retrying as mp4...\n")
+                sys.stderr.flush()
+            except Exception:
+                pass
+            task_preview(m, v, progress=progress, cancel=cancel, fmt="mp4")
+    elif task == "sprites":
+        task_sprites(m, v)
+    elif task == "scenes":
+        task_scenes(m, v, thumbs=bool(opts.get("scene_thumbs")), clips=bool(opts.get("scene_clips")))
+    elif task == "heatmap":
+        task_heatmap(m, v, png=bool(opts.get("heatmap_png")))
+    elif task == "phash":
+        task_phash(m, v)
+    else:
+        raise ValueError(f"unknown task {task}")
+    # A running server caches /api/library by ETag; tell it artifacts changed under it
+    touch = getattr(m, "_touch_artifacts_generation", None)
+    if touch is not None:
+        touch()
+
+
+def _file_signature(v: Path) -> str:
+    try:
+        st = v.stat()
+        return f"{st.st_mtime_ns}:{st.st_size}"
+    except Exception:
+        return "missing"
+
+
+class Checkpoint:
+    """Append-only JSONL record of completed (file, step) pairs so interrupted runs can resume.
+    A step only counts as done while the file's mtime/size signature is unchanged.
+    """
+
+    def __init__(self, path: Optional[Path], *, resume: bool):
+        self.path = path
+        self._lock = threading.Lock()
+        self._done: dict[str, set[str]] = {}
+        self._fh = None
+        if path is None:
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        torn = False
+        if resume and path.exists():
+            text = path.read_text(errors="ignore")
+            # A run killed mid-write leaves a partial last line; start appending on a fresh one
+            torn = bool(text) and not text.endswith("\n")
+            for line in text.splitlines():
+                try:
+                    rec = json.loads(line)
+                    self._done.setdefault(f"{rec['path']}|{rec['sig']}", set()).add(str(rec["step"]))
+                except Exception:
+                    continue
+        self._fh = open(path, "a" if resume else "w", encoding="utf-8")
+        if torn:
+            self._fh.write("\n")
+
+    def done_steps(self, v: Path) -> set[str]:
+        return set(self._done.get(f"{v}|{_file_signature(v)}", set()))
+
+    def mark(self, v: Path, step: str) -> None:
+        if self._fh is None:
+            return
+        sig = _file_signature(v)
+        with self._lock:
+            self._done.setdefault(f"{v}|{sig}", set()).add(step)
+            self._fh.write(json.dumps({"path": str(v), "sig": sig, "step": step}) + "\n")
+            self._fh.flush()
+
+    def close(self) -> None:
+        if self._fh is not None:
+            try:
+                self._fh.close()
+            except Exception:
+                pass
+            self._fh = None
+
+
+# --- Process-pool worker side (module level so it pickles under spawn) ---
+_PROC_APP = None
+_PROC_OPTS: dict = {}
+_PROC_EVENTS = None
+_PROC_CANCEL = None
+
+
+def _process_worker_init(opts: dict, events, cancel) -> None:
+    """Initialise one worker process: apply its ffmpeg budget, then import app once."""
+    global _PROC_APP, _PROC_OPTS, _PROC_EVENTS, _PROC_CANCEL
+    try:
+        # Parent owns Ctrl-C handling and signals cancellation through the shared event
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    except Exception:
+        pass
+    for key, val in (opts.get("env") or {}).items():
+        os.environ[str(key)] = str(val)
+    _PROC_OPTS = dict(opts)
+    _PROC_EVENTS = events
+    _PROC_CANCEL = cancel
+    _PROC_APP = import_app_module()
+
+
+def _process_emit(kind: str, path: str, label: str = "", extra: Any = None) -> None:
+    try:
+        if _PROC_EVENTS is not None:
+            _PROC_EVENTS.put((kind, os.getpid(), path, label, extra))
+    except Exception:
+        pass
+
+
+def _process_worker_run(path: str, done_steps: list[str]) -> Optional[str]:
+    m = _PROC_APP
+    opts = _PROC_OPTS
+    v = Path(path)
+    skip = set(done_steps or [])
+    only_missing = not opts.get("recompute_all")
+    cancelled = (lambda: bool(_PROC_CANCEL is not None and _PROC_CANCEL.is_set()))
+    _process_emit("start", path)
+    try:
+        for step in steps_for(str(opts.get("what") or "all")):
+            if cancelled():
+                return f"{v}: cancelled"
+            if step in skip:
+                _process_emit("step", path, f"{step} (resume)")
+                continue
+            if only_missing and artifact_exists(m, step, v, str(opts.get("preview_fmt") or "webm")):
+                _process_emit("step", path, f"{step} (skip)", step)
+                continue
+            _process_emit("begin", path, step)
+            progress = (lambda i, total, _s=step: _process_emit("progress", path, f"{_s} {i}/{total}"))
+            run_step(m, step, v, opts, progress=progress if step == "preview" else None, cancel=cancelled)
+            _process_emit("step", path, step, step)
+        return None
+    except Exception as e:
+        return f"{v}: {e}"
+    finally:
+        _process_emit("end", path)
+
+
+def run_process_pool(videos: list[Path], *, workers: int, opts: dict, checkpoint: Checkpoint,
+                     cancel_event: threading.Event, tqdm_fn: Optional[Callable[..., Any]]) -> list[str]:
+    """Fan videos out to a ProcessPoolExecutor; one reporter thread drains worker events."""
+    ctx = mp.get_context("spawn")
+    manager = ctx.Manager()
+    events = manager.Queue()
+    shared_cancel = manager.Event()
+    # Children must not try to re-exec into a venv while being spawned
+    os.environ["MP_VENV_BOOTSTRAPPED"] = "1"
+    n_steps = len(steps_for(str(opts.get("what") or "all")))
+    total = len(videos)
+    bar = tqdm_fn(total=total * n_steps, ncols=80) if tqdm_fn else None
+    stop_reporter = threading.Event()
+
+    def _reporter() -> None:
+        while not (stop_reporter.is_set() and events.empty()):
+            try:
+                kind, pid, path, label, step = events.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            except Exception:
+                break
+            name = Path(path).name
+            if kind == "step":
+                if step:
+                    checkpoint.mark(Path(path), str(step))
+                if bar is not None:
+                    bar.set_postfix_str(f"{name[:24]} {label}")
+                    bar.update(1)
+                else:
+                    print(f"[cli] [pid {pid}] {name}: {label}")
+            elif kind == "begin" and bar is None:
+                try:
+                    sys.stderr.write(f"[cli] [pid {pid}] {name}: starting {label}...\n")
+                    sys.stderr.flush()
+                except Exception:
+                    pass
+            elif kind == "progress" and bar is not None:
+                bar.set_postfix_str(f"{name[:24]} {label}")
+
+    reporter = threading.Thread(target=_reporter, name="cli-progress", daemon=True)
+    reporter.start()
+    errors: list[str] = []
+    try:
+        with cf.ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=ctx,
+            initializer=_process_worker_init,
+            initargs=(opts, events, shared_cancel),
+        ) as ex:
+            futures = {ex.submit(_process_worker_run, str(v), sorted(checkpoint.done_steps(v))): v for v in videos}
+            pending = set(futures)
+            while pending:
+                done, pending = cf.wait(pending, timeout=0.5, return_when=cf.FIRST_COMPLETED)
+                if cancel_event.is_set() and not shared_cancel.is_set():
+                    shared_cancel.set()
+                    for f in pending:
+                        f.cancel()
+                for fut in done:
+                    try:
+                        res = fut.result()
+                    except cf.CancelledError:
+                        res = f"{futures[fut]}: cancelled"
+                    except Exception as e:
+                        res = f"{futures[fut]}: {e}"
+                    if res:
+                        errors.append(res)
+                        print(f"[cli] ERROR: {res}", file=sys.stderr)
+    finally:
+        stop_reporter.set()
+        reporter.join(timeout=5)
+        if bar is not None:
+            bar.close()
+        manager.shutdown()
+    return errors
+
+
 def main(argv: list[str]) -> int:
     ap = argparse.ArgumentParser(description="Generate media artifacts without running server")
     ap.add_argument("--root", default=os.environ.get("MEDIA_ROOT", os.getcwd()), help="Directory containing media files")
@@ -188,8 +471,13 @@ def main(argv: list[str]) -> int:
         "all", "thumb", "preview", "sprites", "scenes", "heatmap", "phash", "metadata"
     ], help="Which artifact(s) to generate")
     ap.add_argument("--force", action="store_true", help="Force overwrite where applicable")
-    # Align with server default JOB_MAX_CONCURRENCY=4 (overridable via env)
-    ap.add_argument("--concurrency", type=int, default=int(os.environ.get("JOB_MAX_CONCURRENCY", "4")), help="Max parallel workers")
+    # Thread mode aligns with server default JOB_MAX_CONCURRENCY=4; process mode defaults to one worker per CPU
+    ap.add_argument("--concurrency", type=int, default=None, help="Max parallel workers (thread: JOB_MAX_CONCURRENCY or 4; process: CPU count)")
+    ap.add_argument("--workers-mode", default=os.environ.get("ARTIFACTS_WORKERS_MODE", "thread"), choices=["thread", "process"], help="Run files on threads sharing one app instance, or on worker processes each importing app once")
+    ap.add_argument("--ffmpeg-per-worker", type=int, default=1, help="Process mode: concurrent ffmpeg invocations allowed inside each worker (FFMPEG_CONCURRENCY)")
+    ap.add_argument("--checkpoint", default=None, help="Checkpoint file recording completed steps (default: <root>/.artifacts/artifacts-cli.checkpoint.jsonl)")
+    ap.add_argument("--resume", action="store_true", help="Skip steps recorded in the checkpoint for unchanged files")
+    ap.add_argument("--no-checkpoint", action="store_true", help="Do not write a checkpoint file")
     ap.add_argument("--scene-thumbs", action="store_true", help="For scenes: write thumbnail JPEGs")
     ap.add_argument("--scene-clips", action="store_true", help="For scenes: write MP4 clips")
     ap.add_argument("--heatmap-png", action="store_true", help="For heatmap: also write PNG strip")
@@ -268,24 +556,54 @@ def main(argv: list[str]) -> int:
         tqdm_fn = None
     use_tqdm = bool(tqdm_fn and (sys.stderr.isatty() or sys.stdout.isatty()))
 
-    # Determine steps per job based on --what
-    def steps_for_job() -> list[str]:
-        if args.what == "all":
-            return [
-                "metadata",
-                "thumb",
-                # Keep sprites and preview adjacent; server runs them in the same phase
-                "sprites",
-                "preview",
-                "scenes",
-                "heatmap",
-                "phash"
-            ]
-        return [args.what]
-
-    workers = max(1, int(args.concurrency))
+    if args.concurrency is not None:
+        workers = max(1, int(args.concurrency))
+    elif args.workers_mode == "process":
+        workers = max(1, os.cpu_count() or 1)
+    else:
+        workers = max(1, int(os.environ.get("JOB_MAX_CONCURRENCY", "4")))
     total = len(videos)
-    print(f"[cli] Processing {total} video(s) with concurrency={workers}")
+    print(f"[cli] Processing {total} video(s) with concurrency={workers} ({args.workers_mode} mode)")
+
+    if args.no_checkpoint:
+        checkpoint = Checkpoint(None, resume=False)
+    else:
+        ck_path = Path(args.checkpoint).expanduser() if args.checkpoint else (root / ".artifacts" / "artifacts-cli.checkpoint.jsonl")
+        checkpoint = Checkpoint(ck_path, resume=bool(args.resume))
+    # Effective skipping mode: default to only-missing unless --recompute-all is used
+    only_missing = not args.recompute_all
+    opts = {
+        "what": args.what,
+        "force": bool(args.force),
+        "preview_fmt": args.preview_fmt,
+        "scene_thumbs": bool(args.scene_thumbs),
+        "scene_clips": bool(args.scene_clips),
+        "heatmap_png": bool(args.heatmap_png),
+        "recompute_all": bool(args.recompute_all),
+    }
+
+    if args.workers_mode == "process":
+        # Split the CPU between workers so N processes x ffmpeg threads does not oversubscribe
+        cpu = os.cpu_count() or 1
+        opts["env"] = {
+            "MEDIA_ROOT": os.environ.get("MEDIA_ROOT", str(root)),
+            "FFMPEG_CONCURRENCY": str(max(1, int(args.ffmpeg_per_worker))),
+            "FFMPEG_THREADS": str(max(1, cpu // workers)),
+        }
+        try:
+            errors = run_process_pool(
+                videos,
+                workers=workers,
+                opts=opts,
+                checkpoint=checkpoint,
+                cancel_event=cancel_event,
+                tqdm_fn=tqdm_fn if use_tqdm else None,
+            )
+        finally:
+            checkpoint.close()
+        return _report_errors(errors)
+
+    steps = steps_for(args.what)
 
     # Slot-based multi-bar manager (limit to #workers visible at once)
     class BarSlot:
@@ -305,7 +623,7 @@ def main(argv: list[str]) -> int:
                 if not s.in_use:
                     s.in_use = True
                     # Create bar lazily
-                    s.bar = tqdm_fn(total=len(steps_for_job()), position=s.pos, leave=False, ncols=80)
+                    s.bar = tqdm_fn(total=len(steps), position=s.pos, leave=False, ncols=80)
                     return s
         # No free slot; return a dummy (no bar), will print lines instead
         return None
@@ -322,55 +640,15 @@ def main(argv: list[str]) -> int:
             slot.bar = None
             slot.in_use = False
 
-    def artifact_exists(task: str, v: Path) -> bool:
-        try:
-            if task == "metadata":
-                return m.metadata_path(v).exists()
-            if task == "thumb":
-                return m.thumbs_path(v).exists()
-            if task == "preview":
-                fmt = args.preview_fmt
-                p = (m.artifact_dir(v) / f"{v.stem}.preview.{fmt}")
-                try:
-                    return p.exists() and p.stat().st_size > 0
-                except Exception:
-                    return p.exists()
-            if task == "sprites":
-                try:
-                    sheet, jpath = m.sprite_sheet_paths(v)
-                    return sheet.exists() and jpath.exists()
-                except Exception:
-                    return False
-            if task == "scenes":
-                try:
-                    # Prefer strict server helper when available
-                    return bool(getattr(m, "scenes_json_exists")(v))  # type: ignore[misc]
-                except Exception:
-                    return m.scenes_json_path(v).exists()
-            if task == "heatmap":
-                try:
-                    return bool(getattr(m, "heatmap_json_exists")(v))  # type: ignore[misc]
-                except Exception:
-                    return m.heatmap_json_path(v).exists()
-            if task == "phash":
-                return m.phash_path(v).exists()
-        except Exception:
-            return False
-        return False
-
     # Per-file job
     def run_job(v: Path) -> str | None:
-        steps = steps_for_job()
         slot = acquire_slot()
         name = v.name
         # Initialize bar description
         if slot and slot.bar:
             slot.bar.set_description_str(name[:40])
         completed = 0
-        # Effective skipping mode: default to only-missing unless --recompute-all is used
-        only_missing = True if not args.recompute_all else False
-        if args.only_missing is True and not args.recompute_all:
-            only_missing = True
+        resumed = checkpoint.done_steps(v) if args.resume else set()
 
         def advance(label: str):
             nonlocal completed
@@ -393,141 +671,35 @@ def main(argv: list[str]) -> int:
                 except Exception:
                     pass
 
+        # Preview progress: update bar postfix or print simple progress
+        def _preview_progress(i: int, total: int):
+            if slot and slot.bar:
+                try:
+                    slot.bar.set_postfix_str(f"preview {i}/{total}")
+                except Exception:
+                    pass
+            else:
+                try:
+                    sys.stderr.write(f"[cli] {name}: preview {i}/{total}\n")
+                    sys.stderr.flush()
+                except Exception:
+                    pass
+
         try:
-            # Early cancellation before starting
-            if cancel_event.is_set():
-                return f"{v}: cancelled"
-            if args.what == "all":
-                if only_missing and artifact_exists("metadata", v):
-                    advance("metadata (skip)")
-                else:
-                    starting("metadata"); task_metadata(m, v, args.force); advance("metadata")
-                if cancel_event.is_set():
-                    return f"{v}: cancelled"
-                if only_missing and artifact_exists("thumb", v):
-                    advance("thumb (skip)")
-                else:
-                    starting("thumb"); task_thumb(m, v, args.force); advance("thumb")
-                if cancel_event.is_set():
-                    return f"{v}: cancelled"
-                # Preview progress: update bar postfix or print simple progress
-                def _preview_progress(i: int, total: int):
-                    if slot and slot.bar:
-                        try:
-                            slot.bar.set_postfix_str(f"preview {i}/{total}")
-                        except Exception:
-                            pass
-                    else:
-                        try:
-                            sys.stderr.write(f"[cli] {name}: preview {i}/{total}\n")
-                            sys.stderr.flush()
-                        except Exception:
-                            pass
-                if only_missing and artifact_exists("preview", v):
-                    advance("preview (skip)")
-                else:
-                    starting("preview")
-                    try:
-                        # Always provide progress; server handles single-pass progress internally when enabled
-                        task_preview(m, v, progress=_preview_progress, cancel=cancel_event.is_set, fmt=args.preview_fmt)
-                    except Exception as e:
-                        # If webm fails, retry once with mp4 as a fallback
-                        if args.preview_fmt == "webm":
-                            try:
-                                sys.stderr.write(f"[cli] {name}: webm failed ({e}); retrying as mp4...\n")
-                                sys.stderr.flush()
-                            except Exception:
-                                pass
-                            task_preview(m, v, progress=_preview_progress, cancel=cancel_event.is_set, fmt="mp4")
-                        else:
-                            raise
-                    advance("preview")
-                if cancel_event.is_set():
-                    return f"{v}: cancelled"
-                if only_missing and artifact_exists("sprites", v):
-                    advance("sprites (skip)")
-                else:
-                    starting("sprites"); task_sprites(m, v); advance("sprites")
-                if cancel_event.is_set():
-                    return f"{v}: cancelled"
-                if only_missing and artifact_exists("scenes", v):
-                    advance("scenes (skip)")
-                else:
-                    starting("scenes"); task_scenes(m, v, thumbs=args.scene_thumbs, clips=args.scene_clips); advance("scenes")
+            for step in steps:
                 if cancel_event.is_set():
                     return f"{v}: cancelled"
-                if only_missing and artifact_exists("heatmap", v):
-                    advance("heatmap (skip)")
-                else:
-                    starting("heatmap"); task_heatmap(m, v, png=args.heatmap_png); advance("heatmap")
-                if cancel_event.is_set():
-                    return f"{v}: cancelled"
-                if only_missing and artifact_exists("phash", v):
-                    advance("phash (skip)")
-                else:
-                    starting("phash"); task_phash(m, v); advance("phash")
-            elif args.what == "metadata":
-                if only_missing and artifact_exists("metadata", v):
-                    advance("metadata (skip)")
-                else:
-                    starting("metadata"); task_metadata(m, v, args.force); advance("metadata")
-            elif args.what == "thumb":
-                if only_missing and artifact_exists("thumb", v):
-                    advance("thumb (skip)")
-                else:
-                    starting("thumb"); task_thumb(m, v, args.force); advance("thumb")
-            elif args.what == "preview":
-                if only_missing and artifact_exists("preview", v):
-                    advance("preview (skip)")
-                else:
-                    def _preview_progress2(i: int, total: int):
-                        if slot and slot.bar:
-                            try:
-                                slot.bar.set_postfix_str(f"preview {i}/{total}")
-                            except Exception:
-                                pass
-                        else:
-                            try:
-                                sys.stderr.write(f"[cli] {name}: preview {i}/{total}\n")
-                                sys.stderr.flush()
-                            except Exception:
-                                pass
-                    starting("preview")
-                    try:
-                        task_preview(m, v, progress=_preview_progress2, cancel=cancel_event.is_set, fmt=args.preview_fmt)
-                    except Exception as e:
-                        if args.preview_fmt == "webm":
-                            try:
-                                sys.stderr.write(f"[cli] {name}: webm failed ({e}); retrying as mp4...\n")
-                                sys.stderr.flush()
-                            except Exception:
-                                pass
-                            task_preview(m, v, progress=_preview_progress2, cancel=cancel_event.is_set, fmt="mp4")
-                        else:
-                            raise
-                    advance("preview")
-            elif args.what == "sprites":
-                if only_missing and artifact_exists("sprites", v):
-                    advance("sprites (skip)")
-                else:
-                    starting("sprites"); task_sprites(m, v); advance("sprites")
-            elif args.what == "scenes":
-                if only_missing and artifact_exists("scenes", v):
-                    advance("scenes (skip)")
-                else:
-                    starting("scenes"); task_scenes(m, v, thumbs=args.scene_thumbs, clips=args.scene_clips); advance("scenes")
-            elif args.what == "heatmap":
-                if only_missing and artifact_exists("heatmap", v):
-                    advance("heatmap (skip)")
-                else:
-                    starting("heatmap"); task_heatmap(m, v, png=args.heatmap_png); advance("heatmap")
-            elif args.what == "phash":
-                if only_missing and artifact_exists("phash", v):
-                    advance("phash (skip)")
-                else:
-                    starting("phash"); task_phash(m, v); advance("phash")
-            else:
-                return f"unknown task {args.what}"
+                if step in resumed:
+                    advance(f"{step} (resume)")
+                    continue
+                if only_missing and artifact_exists(m, step, v, args.preview_fmt):
+                    advance(f"{step} (skip)")
+                    checkpoint.mark(v, step)
+                    continue
+                starting(step)
+                run_step(m, step, v, opts, progress=_preview_progress if step == "preview" else None, cancel=cancel_event.is_set)
+                checkpoint.mark(v, step)
+                advance(step)
             return None
         except Exception as e:
             return f"{v}: {e}"
@@ -539,41 +711,47 @@ def main(argv: list[str]) -> int:
     is_tty = sys.stdout.isatty() or sys.stderr.isatty()
     show_simple_overall = (is_tty and not use_tqdm)
     # Submit futures so we can cancel pending ones if needed
-    with cf.ThreadPoolExecutor(max_workers=workers) as ex:
-        futures: list[cf.Future] = []
-        for v in videos:
-            if cancel_event.is_set():
-                break
-            futures.append(ex.submit(run_job, v))
-        # Collect results as they finish
-        for fut in cf.as_completed(futures):
-            try:
-                res = fut.result()
-            except Exception as e:
-                res = str(e)
-            # Update overall simple progress if enabled
-            done_count += 1
-            if show_simple_overall and total > 0:
-                pct = int((done_count / total) * 100)
+    try:
+        with cf.ThreadPoolExecutor(max_workers=workers) as ex:
+            futures: list[cf.Future] = []
+            for v in videos:
+                if cancel_event.is_set():
+                    break
+                futures.append(ex.submit(run_job, v))
+            # Collect results as they finish
+            for fut in cf.as_completed(futures):
                 try:
-                    sys.stdout.write(f"\r[cli] Overall: {done_count}/{total} ({pct}%)    ")
-                    sys.stdout.flush()
-                except Exception:
-                    pass
-            if res:
-                # If cancelled, try to cancel remaining pending futures
-                if "cancelled" in res:
-                    for f in futures:
-                        f.cancel()
-                errors.append(res)
-                print(f"[cli] ERROR: {res}", file=sys.stderr)
+                    res = fut.result()
+                except Exception as e:
+                    res = str(e)
+                # Update overall simple progress if enabled
+                done_count += 1
+                if show_simple_overall and total > 0:
+                    pct = int((done_count / total) * 100)
+                    try:
+                        sys.stdout.write(f"\r[cli] Overall: {done_count}/{total} ({pct}%)    ")
+                        sys.stdout.flush()
+                    except Exception:
+                        pass
+                if res:
+                    # If cancelled, try to cancel remaining pending futures
+                    if "cancelled" in res:
+                        for f in futures:
+                            f.cancel()
+                    errors.append(res)
+                    print(f"[cli] ERROR: {res}", file=sys.stderr)
+    finally:
+        checkpoint.close()
     if show_simple_overall:
         try:
             sys.stdout.write("\n")
             sys.stdout.flush()
         except Exception:
             pass
+    return _report_errors(errors)
+
 
+def _report_errors(errors: list[str]) -> int:
     if errors:
         # Distinguish pure-cancel from real errors
         only_cancel = all("cancelled" in e for e in errors)
@@ -0,0 +1,65 @@
+from __future__ import annotations
+import sys
+import tempfile
+import argparse
+from pathlib import Path
+
+# Import the index without building the server's route table
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from tools import artifact_lib  # type: ignore
+
+
+def _synthetic_index(mod, directory: Path, rows: int, clusters: int, seed: int):
+    """Clustered random unit vectors written through the real index code (upsert -> memmap)."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    dim = mod.VISUAL_EMBED_DIM
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    idx = mod._VisualIndex(directory)
+    batch: dict = {}
+    for i in range(rows):
+        v = centers[i % clusters] + 0.35 * rng.normal(size=dim).astype(np.float32)
+        batch[f"synthetic/{i:07d}.mp4"] = ("0:0", v / np.linalg.norm(v))
+        if len(batch) >= 5000:
+            idx.upsert(batch)
+            batch = {}
+    idx.upsert(batch)
+    return idx
+
+
+def bench(idx, *, k: int, queries: int, nprobes: list[int], nlist: int, retrain: bool) -> None:
+    if retrain or idx.centroids is None:
+        info = idx.train_ivf(nlist or None)
+        print(f"Trained IVF: {info}")
+    report = idx.benchmark(k=k, queries=queries, nprobes=nprobes)
+    print(f"\nANN benchmark: rows={report['rows']} nlist={report['nlist']} k={report['k']} queries={report['queries']}")
+    print(f" - exact scan        : {report['exact_ms_per_query']:.3f} ms/query (recall 1.0000)")
+    for ent in report["ivf"]:
+        print(f" - ivf nprobe={ent['nprobe']:<6}: {ent['ms_per_query']:.3f} ms/query recall@{k}={ent['recall']:.4f} speedup x{ent['speedup']}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Benchmark IVF similarity search (recall@K vs exact scan)")
+    ap.add_argument("--synthetic", type=int, default=0, help="Benchmark a temporary index of N clustered random vectors instead of the library index")
+    ap.add_argument("--clusters", type=int, default=200, help="Clusters in the synthetic data")
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--nprobe", default="1,2,4,8,16,32", help="Comma-separated nprobe values")
+    ap.add_argument("--nlist", type=int, default=0, help="IVF lists (0 = ~4*sqrt(rows) or VISUAL_IVF_NLIST)")
+    ap.add_argument("--train", action="store_true", help="Retrain centroids on the library index before measuring")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    mod = artifact_lib.load_app()
+    probes = [int(x) for x in args.nprobe.split(",") if x.strip()]
+    if args.synthetic:
+        with tempfile.TemporaryDirectory() as tmp:
+            index = _synthetic_index(mod, Path(tmp), args.synthetic, max(1, args.clusters), args.seed)
+            bench(index, k=args.k, queries=args.queries, nprobes=probes, nlist=args.nlist, retrain=True)
+    else:
+        with mod.EMB_INDEX_LOCK:
+            index = mod._visual_index()
+            if len(index) < 2:
+                print("Library index is empty; run the index-embeddings job first or use --synthetic N", file=sys.stderr)
+                sys.exit(2)
+            bench(index, k=args.k, queries=args.queries, nprobes=probes, nlist=args.nlist, retrain=args.train)
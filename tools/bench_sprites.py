@@ -3,11 +3,12 @@ import os
 import sys
 import time
 import argparse
+import json
 from pathlib import Path
 
-# Import from app module
+# Import generators without building the server's route table
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
-import app  # type: ignore
+from tools import artifact_lib as app  # type: ignore
 
 
 def _rm_if_exists(p: Path) -> None:
@@ -18,48 +19,63 @@ def _rm_if_exists(p: Path) -> None:
         pass
 
 
+# (label, env overrides, drop cached keyframe index first)
+MODES = [
+    ("Keyframe index (cold)", {"SPRITES_ENGINE": "keyframe_index"}, True),
+    ("Keyframe index (warm)", {"SPRITES_ENGINE": "keyframe_index"}, False),
+    ("I-frame select", {"SPRITES_ENGINE": "legacy", "SPRITES_KEYFRAMES": "1", "SPRITES_AUTO_EVEN_SEC": "999999"}, False),
+    ("Legacy tile path", {"SPRITES_ENGINE": "legacy", "SPRITES_KEYFRAMES": "0", "SPRITES_AUTO_EVEN_SEC": "999999"}, False),
+    ("Even sampling", {"SPRITES_ENGINE": "legacy", "SPRITES_KEYFRAMES": "0", "SPRITES_EVEN_SAMPLING": "1"}, False),
+]
+_MODE_ENV_KEYS = ("SPRITES_ENGINE", "SPRITES_KEYFRAMES", "SPRITES_EVEN_SAMPLING", "SPRITES_AUTO_EVEN_SEC")
+
+
+def _drop_keyframe_index(file: Path) -> None:
+    mod = app.load_app()
+    rel = mod._rel_from_root(file)
+    with mod.db.session() as conn:
+        conn.execute(
+            "DELETE FROM keyframe_index WHERE media_id IN (SELECT id FROM video WHERE rel_path = ?)",
+            (rel,),
+        )
+    # the .keyframes.bin artifact backs the table and would repopulate it, so drop it too
+    mod.keyframes_path(file).unlink(missing_ok=True)
+
+
 def bench(file: Path, interval: float, width: int, cols: int, rows: int, quality: int) -> None:
     # Ensure artifacts directory exists
     (file.parent / ".artifacts").mkdir(parents=True, exist_ok=True)
     sheet, j = app.sprite_sheet_paths(file)
-
-    # 1) Legacy tile filter path (force off even-sampling and autoswitch)
-    os.environ.pop("SPRITES_EVEN_SAMPLING", None)
-    os.environ["SPRITES_AUTO_EVEN_SEC"] = "999999"  # prevent auto-switch
-    _rm_if_exists(sheet)
-    _rm_if_exists(j)
-    t0 = time.time()
-    app.generate_sprite_sheet(
-        file,
-        interval=interval,
-        width=width,
-        cols=cols,
-        rows=rows,
-        quality=quality,
-    )
-    t1 = time.time()
-    legacy_time = t1 - t0
-
-    # 2) Even sampling path (force on)
-    os.environ["SPRITES_EVEN_SAMPLING"] = "1"
-    os.environ.pop("SPRITES_AUTO_EVEN_SEC", None)
-    _rm_if_exists(sheet)
-    _rm_if_exists(j)
-    t0 = time.time()
-    app.generate_sprite_sheet(
-        file,
-        interval=interval,
-        width=width,
-        cols=cols,
-        rows=rows,
-        quality=quality,
-    )
-    t1 = time.time()
-    even_time = t1 - t0
+    results: list[tuple[str, float, str]] = []
+    for label, env, cold in MODES:
+        for key in _MODE_ENV_KEYS:
+            os.environ.pop(key, None)
+        os.environ.update(env)
+        if cold:
+            _drop_keyframe_index(file)
+        _rm_if_exists(sheet)
+        _rm_if_exists(j)
+        t0 = time.time()
+        app.generate_sprite_sheet(
+            file,
+            interval=interval,
+            width=width,
+            cols=cols,
+            rows=rows,
+            quality=quality,
+        )
+        elapsed = time.time() - t0
+        # Report which strategy actually produced the sheet (engines fall back silently)
+        try:
+            meta = json.loads(j.read_text())
+            used = next((k for k in ("keyframe_index", "keyframes_sampling", "even_sampling") if meta.get(k)), "tile")
+        except Exception:
+            used = "?"
+        results.append((label, elapsed, used))
 
     print("\nSprite benchmark results:")
-    print(f" - Legacy tile path: {legacy_time:.2f}s")
-    print(f" - Even sampling   : {even_time:.2f}s")
+    for label, elapsed, used in results:
+        print(f" - {label:<22}: {elapsed:.2f}s (produced by: {used})")
     print("Artifacts:")
     print(f" - Sheet: {sheet}")
     print(f" - Index: {j}")
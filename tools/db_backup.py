@@ -1,15 +1,25 @@
 #!/usr/bin/env python3
-"""Dump or restore the Media Player SQLite database to/from JSON."""
+"""Dump or restore the Media Player SQLite database.
+
+Formats:
+- json:   one JSON document (legacy; whole DB in memory)
+- ndjson: streamed line-per-row dump, optionally gzip-compressed (.gz); constant memory
+- sqlite: byte-for-byte hot copy through SQLite's online backup API
+"""
 from __future__ import annotations
 
 import argparse
 import datetime as _dt
+import gzip
 import importlib
+import io
+import itertools
 import json
 import os
+import sqlite3
 import sys
 from pathlib import Path
-from typing import Any, Dict, List, Sequence
+from typing import IO, Any, Dict, Iterable, Iterator, List, Sequence
 
 ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
@@ -25,10 +35,22 @@ TABLE_EXPORTS = [
     ("media_tags", "media_tags", "media_id, tag_id"),
     ("media_performers", "media_performers", "media_id, performer_id"),
     ("artifacts", "artifact", "id"),
+    ("markers", "marker", "id"),
+    ("marker_sync", "marker_sync", "media_id"),
     ("jobs", "job", "id"),
+    ("job_items", "job_item", "job_id, seq"),
 ]
 
-SEQUENCED_TABLES = ("video", "tag", "performer", "artifact")
+STREAM_FORMAT = "media-player-ndjson"
+STREAM_FORMAT_VERSION = 1
+FETCH_ROWS = 2000          # rows pulled from the read cursor per fetchmany
+INSERT_CHUNK = 5000        # rows per executemany on restore
+
+SEQUENCED_TABLES = ("video", "tag", "performer", "artifact", "marker", "directory")
+
+# Columns the app derives from other data; ids from another database are
+# meaningless here, so restores drop them and the app re-derives them.
+DERIVED_COLUMNS: Dict[str, frozenset[str]] = {"video": frozenset({"dir_id"})}
 
 
 def _maybe_reexec_into_venv() -> None:
@@ -89,10 +111,14 @@ def _wipe_tables(conn) -> None:
     conn.execute("DELETE FROM \"media_tags\"")
     conn.execute("DELETE FROM \"media_performers\"")
     conn.execute("DELETE FROM \"artifact\"")
+    conn.execute("DELETE FROM \"marker\"")
+    conn.execute("DELETE FROM \"marker_sync\"")
+    conn.execute("DELETE FROM \"job_item\"")
     conn.execute("DELETE FROM \"job\"")
     conn.execute("DELETE FROM \"tag\"")
     conn.execute("DELETE FROM \"performer\"")
     conn.execute("DELETE FROM \"video\"")
+    conn.execute("DELETE FROM \"directory\"")
     try:
         placeholders = ",".join("?" for _ in SEQUENCED_TABLES)
         conn.execute(
@@ -106,7 +132,8 @@ def _wipe_tables(conn) -> None:
 def _insert_rows(conn, table: str, rows: Sequence[dict[str, Any]]) -> int:
     if not rows:
         return 0
-    columns: List[str] = sorted({col for row in rows for col in row.keys()})
+    derived = DERIVED_COLUMNS.get(table, frozenset())
+    columns: List[str] = sorted({col for row in rows for col in row.keys() if col not in derived})
     if not columns:
         return 0
     col_sql = ", ".join(f'"{c}"' for c in columns)
@@ -192,6 +219,237 @@ def restore_from_payload(payload: dict[str, Any], *, replace: bool = False) -> d
     return {"inserted": inserted, "replaced": bool(has_existing and replace)}
 
 
+def _schema_row(conn) -> Any:
+    row = conn.execute("SELECT version, applied_at FROM schema_version WHERE id = 1").fetchone()
+    if row is None:
+        raise RuntimeError("schema_version row missing")
+    return row
+
+
+def write_stream_backup(fh: IO[str]) -> Dict[str, int]:
+    """Write an NDJSON backup row by row from one read snapshot; returns per-section counts.
+
+    Layout: a header line ({"format": ..., "meta": ...}), then per table a
+    {"table", "columns"} line followed by one JSON array per row, then {"end": true, "counts"}.
+    """
+    _bootstrap_modules()
+    assert DB is not None
+    assert APP is not None
+    conn = DB.connect(read_only=True)  # type: ignore[attr-defined]
+    try:
+        # A single read transaction gives every table the same snapshot; under WAL it
+        # does not block writers.
+        conn.execute("BEGIN")
+        schema_row = _schema_row(conn)
+        header = {
+            "format": STREAM_FORMAT,
+            "version": STREAM_FORMAT_VERSION,
+            "meta": {
+                "generated_at": _dt.datetime.now(tz=_dt.timezone.utc).isoformat(),
+                "schema_version": int(schema_row["version"]),
+                "schema_applied_at": int(schema_row["applied_at"]),
+                "db_path": str(DB.path()),  # type: ignore[attr-defined]
+                "media_root": str(APP.STATE.get("root")),
+            },
+        }
+        fh.write(json.dumps(header, ensure_ascii=False) + "\n")
+        counts: Dict[str, int] = {}
+        for section, table, order_by in TABLE_EXPORTS:
+            cur = conn.execute(f"SELECT * FROM \"{table}\" ORDER BY {order_by}")
+            fh.write(json.dumps({"table": section, "columns": [d[0] for d in cur.description]}) + "\n")
+            n = 0
+            while True:
+                rows = cur.fetchmany(FETCH_ROWS)
+                if not rows:
+                    break
+                fh.write("".join(json.dumps(tuple(r), ensure_ascii=False) + "\n" for r in rows))
+                n += len(rows)
+            counts[section] = n
+        fh.write(json.dumps({"end": True, "counts": counts}) + "\n")
+        return counts
+    finally:
+        conn.close()
+
+
+def _iter_stream_lines(fh: Iterable[str]) -> Iterator[Any]:
+    for line in fh:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def restore_from_stream(fh: Iterable[str], *, replace: bool = False, commit_every: int | None = None) -> dict[str, Any]:
+    """Load an NDJSON backup with chunked executemany.
+
+    Everything, including the --replace wipe, runs in one transaction so a truncated
+    or corrupt stream rolls back to the original rows. commit_every opts into
+    committing after roughly that many rows to bound the journal; the restore is then
+    not atomic.
+    """
+    _bootstrap_modules()
+    assert DB is not None
+    lines = _iter_stream_lines(fh)
+    header = next(lines, None)
+    if not isinstance(header, dict) or header.get("format") != STREAM_FORMAT:
+        raise RuntimeError("Not a streamed backup (missing header)")
+    meta = header.get("meta") or {}
+    backup_version = meta.get("schema_version")
+    if backup_version is None:
+        raise RuntimeError("Backup payload missing schema_version")
+    sections = {section: table for section, table, _ in TABLE_EXPORTS}
+    inserted: Dict[str, int] = {}
+    conn = DB.connect()  # type: ignore[attr-defined]
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        schema_row = _schema_row(conn)
+        current_version = int(schema_row["version"])
+        if int(backup_version) != current_version:
+            raise RuntimeError(f"Schema version mismatch: backup={backup_version} current={current_version}")
+        counts = _table_counts(conn)
+        has_existing = any(counts.values())
+        if has_existing and not replace:
+            raise RuntimeError("Database already has data; rerun with --replace to overwrite existing rows.")
+        if has_existing and replace:
+            _wipe_tables(conn)
+
+        sql: str | None = None
+        keep: List[int] = []
+        section: str | None = None
+        chunk: List[tuple] = []
+        since_commit = 0
+        finished = False
+
+        def _flush() -> None:
+            nonlocal since_commit
+            if chunk and sql is not None and section is not None:
+                conn.executemany(sql, chunk)
+                inserted[section] = inserted.get(section, 0) + len(chunk)
+                since_commit += len(chunk)
+                chunk.clear()
+            if commit_every and since_commit >= commit_every:
+                conn.commit()
+                conn.execute("BEGIN IMMEDIATE")
+                since_commit = 0
+
+        for obj in lines:
+            if isinstance(obj, list):
+                if sql is None:
+                    continue  # rows of a table this schema does not know
+                chunk.append(tuple(obj[i] for i in keep))
+                if len(chunk) >= INSERT_CHUNK:
+                    _flush()
+                continue
+            _flush()
+            if obj.get("end"):
+                finished = True
+                break
+            section = str(obj.get("table") or "")
+            table = sections.get(section)
+            if table is None:
+                sql = None
+                continue
+            existing = {r["name"] for r in conn.execute(f"PRAGMA table_info(\"{table}\")")}
+            columns = list(obj.get("columns") or [])
+            derived = DERIVED_COLUMNS.get(table, frozenset())
+            keep = [i for i, c in enumerate(columns) if c in existing and c not in derived]
+            col_sql = ", ".join(f'"{columns[i]}"' for i in keep)
+            placeholders = ", ".join("?" for _ in keep)
+            sql = f"INSERT INTO \"{table}\" ({col_sql}) VALUES ({placeholders})"
+            inserted.setdefault(section, 0)
+        if not finished:
+            raise RuntimeError("Backup stream is truncated (no end marker)")
+        schema_applied_at = meta.get("schema_applied_at")
+        conn.execute(
+            "UPDATE schema_version SET version = ?, applied_at = ? WHERE id = 1",
+            (
+                int(backup_version),
+                int(schema_applied_at) if schema_applied_at is not None else schema_row["applied_at"],
+            ),
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return {"inserted": inserted, "replaced": bool(has_existing and replace)}
+
+
+def hot_copy(dest: str | Path, *, pages: int = -1) -> Path:
+    """Copy the live database byte for byte with SQLite's online backup API.
+
+    pages=-1 copies everything in one step under a single read snapshot (writers keep
+    going under WAL); a positive value copies in steps, which SQLite restarts if another
+    connection writes in between.
+    """
+    _bootstrap_modules()
+    assert DB is not None
+    target = Path(dest)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(target.name + ".tmp")
+    if tmp.exists():
+        tmp.unlink()
+    src = DB.connect(read_only=True)  # type: ignore[attr-defined]
+    try:
+        dst = sqlite3.connect(str(tmp))
+        try:
+            src.backup(dst, pages=int(pages))
+        finally:
+            dst.close()
+    finally:
+        src.close()
+    os.replace(tmp, target)
+    return target
+
+
+def restore_hot_copy(source: str | Path, *, replace: bool = False) -> dict[str, Any]:
+    """Overwrite the configured database with a hot copy made by hot_copy()."""
+    _bootstrap_modules()
+    assert DB is not None
+    src = sqlite3.connect(f"file:{Path(source)}?mode=ro", uri=True)
+    try:
+        dst = DB.connect()  # type: ignore[attr-defined]
+        try:
+            has_existing = any(_table_counts(dst).values())
+            if has_existing and not replace:
+                raise RuntimeError("Database already has data; rerun with --replace to overwrite existing rows.")
+            src.backup(dst)
+        finally:
+            dst.close()
+    finally:
+        src.close()
+    return {"inserted": "all", "replaced": bool(has_existing and replace)}
+
+
+def _infer_format(path: str) -> str:
+    name = path.lower()
+    if name.endswith((".db", ".sqlite", ".sqlite3")):
+        return "sqlite"
+    if name.endswith((".ndjson", ".ndjson.gz", ".jsonl", ".jsonl.gz")):
+        return "ndjson"
+    return "json"
+
+
+def _open_text_out(output: str, *, compress: bool) -> IO[str]:
+    if output in ("-", ""):
+        if compress:
+            return io.TextIOWrapper(gzip.GzipFile(fileobj=sys.stdout.buffer, mode="wb"), encoding="utf-8")
+        return sys.stdout
+    path = Path(output)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8", compresslevel=6)
+    return path.open("w", encoding="utf-8")
+
+
+def _open_text_in(input_path: str) -> IO[str]:
+    raw: IO[bytes] = sys.stdin.buffer if input_path in ("-", "") else Path(input_path).open("rb")
+    buffered = io.BufferedReader(raw) if not isinstance(raw, io.BufferedReader) else raw
+    if buffered.peek(2)[:2] == b"\x1f\x8b":
+        return io.TextIOWrapper(gzip.GzipFile(fileobj=buffered, mode="rb"), encoding="utf-8")
+    return io.TextIOWrapper(buffered, encoding="utf-8")
+
+
 def _write_json(output: str, payload: dict[str, Any], *, compact: bool) -> None:
     target = sys.stdout if output in ("-", "") else Path(output)
     if target is sys.stdout:
@@ -205,42 +463,59 @@ def _write_json(output: str, payload: dict[str, Any], *, compact: bool) -> None:
             fh.write("\n")
 
 
-def _read_json(input_path: str) -> dict[str, Any]:
-    if input_path in ("-", ""):
-        return json.load(sys.stdin)
-    path = Path(input_path)
-    return json.loads(path.read_text(encoding="utf-8"))
-
-
 def _build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Media Player database backup CLI")
     sub = parser.add_subparsers(dest="command", required=True)
 
-    dump_p = sub.add_parser("dump", help="Export the database to JSON")
+    dump_p = sub.add_parser("dump", help="Export the database (JSON, streamed NDJSON, or SQLite hot copy)")
     dump_p.add_argument(
         "-o",
         "--output",
         default="-",
         help="Destination file (default: stdout)",
     )
+    dump_p.add_argument(
+        "--format",
+        choices=("json", "ndjson", "sqlite"),
+        default=None,
+        help="Backup format (default: inferred from the output suffix, else json)",
+    )
+    dump_p.add_argument(
+        "--gzip",
+        action="store_true",
+        help="Gzip-compress ndjson output (implied by a .gz suffix)",
+    )
     dump_p.add_argument(
         "--compact",
         action="store_true",
         help="Emit compact JSON without indentation",
     )
 
-    load_p = sub.add_parser("load", help="Import database contents from JSON")
+    load_p = sub.add_parser("load", help="Import database contents from a backup")
     load_p.add_argument(
         "-i",
         "--input",
         default="-",
-        help="Input file (default: stdin)",
+        help="Input file (default: stdin); json/ndjson and gzip are detected from the content",
+    )
+    load_p.add_argument(
+        "--format",
+        choices=("json", "ndjson", "sqlite"),
+        default=None,
+        help="Backup format (sqlite must be given or inferred from the suffix)",
     )
     load_p.add_argument(
         "--replace",
         action="store_true",
         help="Clear existing tables before importing",
     )
+    load_p.add_argument(
+        "--commit-every",
+        type=int,
+        default=None,
+        help="Commit streamed restores every N rows (default: one transaction; batched "
+        "restores are not atomic, so a truncated stream leaves a partial restore)",
+    )
 
     return parser
 
@@ -250,13 +525,50 @@ def main(argv: Sequence[str] | None = None) -> int:
     args = parser.parse_args(argv)
     try:
         if args.command == "dump":
-            payload = build_backup_payload()
-            _write_json(args.output, payload, compact=bool(args.compact))
-            counts = payload["meta"].get("counts", {})
-            print(f"Exported backup ({counts})", file=sys.stderr)
+            fmt = args.format or _infer_format(args.output)
+            if fmt == "sqlite":
+                if args.output in ("-", ""):
+                    parser.error("sqlite hot copies need an --output file")
+                target = hot_copy(args.output)
+                print(f"Exported hot copy ({target})", file=sys.stderr)
+            elif fmt == "ndjson":
+                fh = _open_text_out(args.output, compress=bool(args.gzip) or args.output.lower().endswith(".gz"))
+                try:
+                    counts = write_stream_backup(fh)
+                finally:
+                    if fh is sys.stdout:
+                        fh.flush()
+                    else:
+                        fh.close()
+                print(f"Exported backup ({counts})", file=sys.stderr)
+            else:
+                payload = build_backup_payload()
+                _write_json(args.output, payload, compact=bool(args.compact))
+                counts = payload["meta"].get("counts", {})
+                print(f"Exported backup ({counts})", file=sys.stderr)
         elif args.command == "load":
-            payload = _read_json(args.input)
-            result = restore_from_payload(payload, replace=bool(args.replace))
+            fmt = args.format or ("sqlite" if _infer_format(args.input) == "sqlite" else None)
+            if fmt == "sqlite":
+                result = restore_hot_copy(args.input, replace=bool(args.replace))
+            else:
+                fh = _open_text_in(args.input)
+                try:
+                    first = fh.readline()
+                    try:
+                        head = json.loads(first)
+                    except ValueError:
+                        head = None
+                    if isinstance(head, dict) and head.get("format") == STREAM_FORMAT:
+                        result = restore_from_stream(
+                            itertools.chain([first], fh),
+                            replace=bool(args.replace),
+                            commit_every=args.commit_every,
+                        )
+                    else:
+                        payload = json.loads(first + fh.read())
+                        result = restore_from_payload(payload, replace=bool(args.replace))
+                finally:
+                    fh.close()
             print(
                 f"Imported backup (replaced={result['replaced']} inserted={result['inserted']})",
                 file=sys.stderr,
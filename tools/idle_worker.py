@@ -1,6 +1,7 @@
 from __future__ import annotations
 from pathlib import Path
-from typing import Callable, Optional, Tuple, List, Dict
+from collections import deque
+from typing import Callable, Deque, Optional, Tuple, List, Dict
 import threading
 import time
 import os
@@ -11,11 +12,131 @@ except Exception:  # pragma: no cover
     psutil = None  # type: ignore
 
 
+# Cheap artifacts first: a tick spent on metadata/thumbnails helps the UI more than one preview.
+KIND_COST: Dict[str, int] = {
+    "metadata": 1,
+    "thumbnail": 2,
+    "phash": 3,
+    "sprites": 4,
+    "heatmap": 5,
+    "preview": 6,
+}
+
+
+class IdlePlanner:
+    """
+    Prioritised queue of missing artifacts for the idle worker.
+
+    Each kind keeps its own queue, refilled from fetch_fn(base, kind, limit, exclude) which is
+    expected to return rel paths newest first (the host answers it from its artifact index).
+    Batches are handed out cheapest kind first. Submitted items are not offered again for
+    retry_after seconds, so a failing file cannot monopolise idle time.
+    """
+
+    def __init__(
+        self,
+        *,
+        fetch_fn: Callable[[Path, str, int, List[str]], List[str]],
+        refill: int = 500,
+        retry_after: float = 3600.0,
+        empty_backoff: float = 300.0,
+    ) -> None:
+        self._fetch_fn = fetch_fn
+        self._refill = max(1, int(refill))
+        self._retry_after = float(retry_after)
+        self._empty_backoff = float(empty_backoff)
+        self._queues: Dict[str, Deque[str]] = {}
+        self._recent: Dict[Tuple[str, str], float] = {}
+        self._empty_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def order(kinds: List[str]) -> List[str]:
+        known = [k for k in kinds if k in KIND_COST]
+        return sorted(dict.fromkeys(known), key=lambda k: KIND_COST[k])
+
+    def _fill(self, base: Path, kind: str, now: float) -> Deque[str]:
+        q = self._queues.setdefault(kind, deque())
+        if q or self._empty_until.get(kind, 0.0) > now:
+            return q
+        recent = [rel for (k, rel), ts in self._recent.items() if k == kind and now - ts < self._retry_after]
+        try:
+            q.extend(self._fetch_fn(base, kind, self._refill, recent))
+        except Exception:
+            pass
+        if not q:
+            self._empty_until[kind] = now + self._empty_backoff
+        return q
+
+    def next_batches(self, base: Path, kinds: List[str], slots: int, batch_size: int) -> List[Tuple[str, List[str]]]:
+        """Up to `slots` batches of at most `batch_size` rel paths, one kind per batch."""
+        now = time.time()
+        out: List[Tuple[str, List[str]]] = []
+        with self._lock:
+            self._recent = {key: ts for key, ts in self._recent.items() if now - ts < self._retry_after}
+            for kind in self.order(kinds):
+                while len(out) < slots:
+                    q = self._fill(base, kind, now)
+                    if not q:
+                        break
+                    batch: List[str] = []
+                    while q and len(batch) < batch_size:
+                        rel = q.popleft()
+                        if (kind, rel) in self._recent:
+                            continue
+                        self._recent[(kind, rel)] = now
+                        batch.append(rel)
+                    if not batch:
+                        break  # refill only returned recently submitted items
+                    out.append((kind, batch))
+                if len(out) >= slots:
+                    break
+        return out
+
+    def invalidate(self) -> None:
+        """Forget queued work (e.g. after a rescan) so the next tick re-queries the index."""
+        with self._lock:
+            self._queues.clear()
+            self._empty_until.clear()
+
+    def pending(self) -> Dict[str, int]:
+        with self._lock:
+            return {k: len(q) for k, q in self._queues.items()}
+
+
+class IdleCapacity:
+    """
+    Sizes idle batches from measured throughput: an EWMA of seconds per item over finished
+    batches, so one batch fills roughly batch_seconds of idle time.
+    """
+
+    def __init__(self, *, batch_seconds: float = 60.0, initial: int = 4, max_batch: int = 200, alpha: float = 0.3) -> None:
+        self.batch_seconds = max(1.0, float(batch_seconds))
+        self.initial = max(1, int(initial))
+        self.max_batch = max(1, int(max_batch))
+        self.alpha = float(alpha)
+        self.sec_per_item: Optional[float] = None
+
+    def observe(self, items: int, elapsed: float) -> None:
+        if items <= 0 or elapsed <= 0:
+            return
+        sample = float(elapsed) / float(items)
+        prev = self.sec_per_item
+        self.sec_per_item = sample if prev is None else (self.alpha * sample + (1.0 - self.alpha) * prev)
+
+    def batch_size(self) -> int:
+        if self.sec_per_item is None:
+            return min(self.initial, self.max_batch)
+        return max(1, min(self.max_batch, int(self.batch_seconds / max(1e-3, self.sec_per_item))))
+
+
 class IdleWorker:
     """
     Background worker that periodically checks CPU idle state and, when idle long enough,
-    asks the host app which artifact to generate next and submits a job for it.
+    asks the host app which artifacts to generate next and submits jobs for them.
 
+    With plan_fn/submit_batch_fn the worker submits one batch per free job slot, sized by
+    IdleCapacity; otherwise it falls back to pick_next_fn/submit_fn (one file per tick).
     This class is decoupled from the application by using injected callables.
     """
 
@@ -25,16 +146,22 @@ class IdleWorker:
         conf_getter: Callable[[], Dict],
         base_path: Path,
         active_jobs_fn: Callable[[], int],
-        pick_next_fn: Callable[[Path, List[str]], Tuple[Optional[str], Optional[str]]],
-        submit_fn: Callable[[str, str], Optional[str]],
+        pick_next_fn: Optional[Callable[[Path, List[str]], Tuple[Optional[str], Optional[str]]]] = None,
+        submit_fn: Optional[Callable[[str, str], Optional[str]]] = None,
+        plan_fn: Optional[Callable[[Path, List[str], int, int], List[Tuple[str, List[str]]]]] = None,
+        submit_batch_fn: Optional[Callable[[str, List[str]], Optional[str]]] = None,
     ) -> None:
         self._conf_getter = conf_getter
         self._base = base_path
         self._active_jobs_fn = active_jobs_fn
         self._pick_next_fn = pick_next_fn
         self._submit_fn = submit_fn
+        self._plan_fn = plan_fn
+        self._submit_batch_fn = submit_batch_fn
         self._stop = threading.Event()
         self._th: Optional[threading.Thread] = None
+        self.capacity = IdleCapacity()
+        self._inflight: Optional[Tuple[float, int]] = None  # (submitted at, items) of the current idle wave
 
     def start(self) -> None:
         if self._th and self._th.is_alive():
@@ -71,11 +198,31 @@ class IdleWorker:
         except Exception:
             return False
 
+    def _submit_planned(self, kinds: List[str], slots: int) -> bool:
+        """Submit up to `slots` planned batches; True if anything was submitted."""
+        assert self._plan_fn is not None and self._submit_batch_fn is not None
+        try:
+            batches = self._plan_fn(self._base, kinds, slots, self.capacity.batch_size())
+        except Exception:
+            batches = []
+        items = 0
+        for kind, rels in batches:
+            try:
+                if self._submit_batch_fn(kind, rels):
+                    items += len(rels)
+            except Exception:
+                pass
+        if items:
+            self._inflight = (time.time(), items)
+        return bool(batches)
+
     def _loop(self) -> None:
         conf = dict(self._conf_getter() or {})
         min_idle = int(conf.get("min_idle_seconds", 60) or 60)
         poll = max(3, int(conf.get("poll_seconds", 15) or 15))
         max_conc = int(conf.get("max_concurrent", 1) or 1)
+        self.capacity.batch_seconds = float(conf.get("batch_seconds", poll * 4) or poll * 4)
+        self.capacity.max_batch = max(1, int(conf.get("max_batch", 200) or 200))
         kinds = [str(x).lower() for x in (conf.get("artifacts") or []) if str(x)]
         if not kinds:
             kinds = ["metadata", "thumbnail", "preview"]
@@ -90,8 +237,16 @@ class IdleWorker:
                 running = int(self._active_jobs_fn())
             except Exception:
                 running = 0
-            if running >= max_conc:
-                idle_accum = 0.0
+            if self._inflight is not None and running == 0:
+                # The last idle wave drained: feed its wall time back into batch sizing
+                started, items = self._inflight
+                self.capacity.observe(items, now - started)
+                self._inflight = None
+                idle_accum = float(min_idle)  # still catching up: next wave only needs an idle CPU check
+            if running >= max_conc or self._inflight is not None:
+                # Busy, or our own wave is still running (wait for it to drain so it can be timed)
+                if running >= max_conc:
+                    idle_accum = 0.0
                 self._stop.wait(poll)
                 continue
             # Check idle
@@ -103,7 +258,12 @@ class IdleWorker:
                 idle_accum += dt
             else:
                 idle_accum = 0.0
-            if idle_accum >= min_idle:
+            if idle_accum >= min_idle and self._plan_fn is not None and self._submit_batch_fn is not None:
+                if self._submit_planned(kinds, max(1, max_conc - running)):
+                    idle_accum = 0.0
+                self._stop.wait(poll)
+                continue
+            if idle_accum >= min_idle and self._pick_next_fn is not None and self._submit_fn is not None:
                 kind, rel = None, None
                 try:
                     kind, rel = self._pick_next_fn(self._base, kinds)
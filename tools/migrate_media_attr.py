@@ -20,6 +20,8 @@ import json
 import os
 import shutil
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
@@ -77,7 +79,7 @@ def import_app_module():
     sroot = str(root)
     if sroot not in sys.path:
         sys.path.insert(0, sroot)
-    return importlib.import_module("app")
+    return importlib.import_module("tools.artifact_lib").load_app()
 
 
 APP = None  # lazily populated in main()
@@ -176,7 +178,31 @@ def build_stem_index(app_mod, root: Path, attr_map: dict[str, dict[str, list[str
     return index
 
 
-def load_tags_sidecars(root: Path, stem_index: dict[str, list[str]]) -> tuple[dict[str, dict[str, Any]], dict[str, Path], dict[str, Any]]:
+def _parse_tags_sidecar(candidate: Path) -> dict[str, Any]:
+    data = json.loads(candidate.read_text())
+    return {
+        "description": str(data.get("description") or ""),
+        "rating": _clamp_rating(data.get("rating")),
+        "favorite": _bool(data.get("favorite")),
+        "tags": _clean_text_list(data.get("tags") or []),
+        "performers": _clean_text_list(data.get("performers") or []),
+    }
+
+
+def _default_workers() -> int:
+    return max(1, min(16, (os.cpu_count() or 1) * 2))
+
+
+def load_tags_sidecars(
+    root: Path,
+    stem_index: dict[str, list[str]],
+    workers: int = 1,
+) -> tuple[dict[str, dict[str, Any]], dict[str, Path], dict[str, Any]]:
+    """Load every mappable ``<stem>.tags.json`` sidecar.
+
+    With ``workers > 1`` the files are read and parsed on a thread pool; the
+    per-file cost is dominated by open/read syscalls so threads scale well.
+    """
     base = root / ".artifacts" / "scenes"
     entries: dict[str, dict[str, Any]] = {}
     sources: dict[str, Path] = {}
@@ -188,40 +214,40 @@ def load_tags_sidecars(root: Path, stem_index: dict[str, list[str]]) -> tuple[di
     }
     if not base.exists():
         return entries, sources, stats
-    for child in base.iterdir():
-        if not child.is_dir():
-            continue
-        stem = child.name
-        candidate = child / f"{stem}.tags.json"
-        if not candidate.exists():
-            continue
-        rel_candidates = stem_index.get(stem, [])
-        target_rel: str | None = None
-        if len(rel_candidates) == 1:
-            target_rel = rel_candidates[0]
-        elif len(rel_candidates) == 0:
-            stats["unmapped"].append(str(candidate))
-            continue
-        else:
-            stats["ambiguous"].append({"stem": stem, "file": str(candidate), "choices": rel_candidates})
-            continue
+    pending: list[tuple[str, Path]] = []
+    with os.scandir(base) as it:
+        for child in it:
+            if not child.is_dir():
+                continue
+            stem = child.name
+            candidate = Path(child.path) / f"{stem}.tags.json"
+            if not candidate.exists():
+                continue
+            rel_candidates = stem_index.get(stem, [])
+            if len(rel_candidates) == 1:
+                pending.append((rel_candidates[0], candidate))
+            elif len(rel_candidates) == 0:
+                stats["unmapped"].append(str(candidate))
+            else:
+                stats["ambiguous"].append({"stem": stem, "file": str(candidate), "choices": rel_candidates})
+
+    def _load(item: tuple[str, Path]) -> tuple[str, Path, Optional[dict[str, Any]], Optional[str]]:
+        rel, candidate = item
         try:
-            data = json.loads(candidate.read_text())
+            return rel, candidate, _parse_tags_sidecar(candidate), None
         except Exception as exc:
-            stats["parse_errors"].append({"file": str(candidate), "error": str(exc)})
+            return rel, candidate, None, str(exc)
+
+    if workers > 1 and len(pending) > 1:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sidecar") as pool:
+            results = list(pool.map(_load, pending))
+    else:
+        results = [_load(item) for item in pending]
+    for target_rel, candidate, entry, error in results:
+        if entry is None:
+            stats["parse_errors"].append({"file": str(candidate), "error": error})
             continue
-        desc = str(data.get("description") or "")
-        rating = _clamp_rating(data.get("rating"))
-        favorite = _bool(data.get("favorite"))
-        tags = _clean_text_list(data.get("tags") or [])
-        performers = _clean_text_list(data.get("performers") or [])
-        entries[target_rel] = {
-            "description": desc,
-            "rating": rating,
-            "favorite": favorite,
-            "tags": tags,
-            "performers": performers,
-        }
+        entries[target_rel] = entry
         sources[target_rel] = candidate
         stats["processed"] += 1
     return entries, sources, stats
@@ -423,6 +449,311 @@ def diff_metadata(source: dict[str, dict[str, Any]], dest: dict[str, dict[str, A
     return diffs
 
 
+# ---------------------------------------------------------------------------
+# Bulk import (set-based)
+# ---------------------------------------------------------------------------
+
+_NORM_SEP = "\x1f"
+
+_STAGE_DDL = """
+CREATE TEMP TABLE IF NOT EXISTS stage_media (
+  rel_path TEXT PRIMARY KEY,
+  has_meta INTEGER NOT NULL DEFAULT 0,
+  description TEXT,
+  rating INTEGER,
+  favorite INTEGER,
+  attr_hash TEXT NOT NULL,
+  meta_hash TEXT,
+  db_attr_hash TEXT,
+  db_meta_hash TEXT,
+  video_id INTEGER
+);
+CREATE TEMP TABLE IF NOT EXISTS stage_tag (
+  rel_path TEXT NOT NULL,
+  name TEXT NOT NULL,
+  norm TEXT NOT NULL,
+  PRIMARY KEY (rel_path, norm)
+);
+CREATE TEMP TABLE IF NOT EXISTS stage_performer (
+  rel_path TEXT NOT NULL,
+  name TEXT NOT NULL,
+  norm TEXT NOT NULL,
+  PRIMARY KEY (rel_path, norm)
+);
+DELETE FROM stage_media;
+DELETE FROM stage_tag;
+DELETE FROM stage_performer;
+"""
+
+# (link table, link column, registry table, staging table)
+_BULK_LINKS = (
+    ("media_tags", "tag_id", "tag", "stage_tag"),
+    ("media_performers", "performer_id", "performer", "stage_performer"),
+)
+
+
+def _registry_pair(name: str) -> Optional[tuple[str, str]]:
+    # Same normalisation as APP._normalize_registry_value so staged norms line
+    # up with the UNIQUE(norm) keys the per-path helpers write.
+    text = str(name).strip()
+    if not text:
+        return None
+    return text, text.casefold()
+
+
+def _attr_row_hash(tag_norms: Optional[str], performer_norms: Optional[str]) -> str:
+    """Order-insensitive digest of one path's tag/performer norms (``\\x1f``-joined)."""
+    tags = sorted({n for n in (tag_norms or "").split(_NORM_SEP) if n})
+    perfs = sorted({n for n in (performer_norms or "").split(_NORM_SEP) if n})
+    payload = json.dumps([tags, perfs], separators=(",", ":"), ensure_ascii=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _meta_row_hash(description: Any, rating: Any, favorite: Any) -> str:
+    payload = json.dumps(
+        [str(description or ""), _clamp_rating(rating), 1 if _bool(favorite) else 0],
+        separators=(",", ":"),
+        ensure_ascii=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _stage_rows(
+    conn,
+    attr_map: dict[str, dict[str, list[str]]],
+    meta_map: dict[str, dict[str, Any]],
+) -> None:
+    conn.executescript(_STAGE_DDL)
+    media_rows: list[tuple[Any, ...]] = []
+    tag_rows: list[tuple[str, str, str]] = []
+    perf_rows: list[tuple[str, str, str]] = []
+    for rel in sorted(attr_map.keys()):
+        entry = attr_map[rel]
+        tag_pairs = [p for p in (_registry_pair(t) for t in entry.get("tags") or []) if p]
+        perf_pairs = [p for p in (_registry_pair(n) for n in entry.get("performers") or []) if p]
+        tag_rows.extend((rel, name, norm) for name, norm in tag_pairs)
+        perf_rows.extend((rel, name, norm) for name, norm in perf_pairs)
+        attr_hash = _attr_row_hash(
+            _NORM_SEP.join(norm for _, norm in tag_pairs),
+            _NORM_SEP.join(norm for _, norm in perf_pairs),
+        )
+        meta = meta_map.get(rel)
+        if meta is None:
+            media_rows.append((rel, 0, None, None, None, attr_hash, None))
+            continue
+        description = str(meta.get("description") or "")
+        rating = _clamp_rating(meta.get("rating"))
+        favorite = 1 if _bool(meta.get("favorite")) else 0
+        media_rows.append(
+            (rel, 1, description, rating, favorite, attr_hash, _meta_row_hash(description, rating, favorite))
+        )
+    conn.executemany(
+        "INSERT INTO stage_media (rel_path, has_meta, description, rating, favorite, attr_hash, meta_hash) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        media_rows,
+    )
+    conn.executemany("INSERT OR IGNORE INTO stage_tag (rel_path, name, norm) VALUES (?, ?, ?)", tag_rows)
+    conn.executemany("INSERT OR IGNORE INTO stage_performer (rel_path, name, norm) VALUES (?, ?, ?)", perf_rows)
+    conn.execute("CREATE INDEX IF NOT EXISTS temp.idx_stage_tag_norm ON stage_tag(norm)")
+    conn.execute("CREATE INDEX IF NOT EXISTS temp.idx_stage_performer_norm ON stage_performer(norm)")
+
+
+def _refresh_db_hashes(conn) -> None:
+    """Resolve video ids and hash the current DB state of every staged row."""
+    conn.execute(
+        "UPDATE stage_media SET video_id = (SELECT v.id FROM video v WHERE v.rel_path = stage_media.rel_path)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS temp.idx_stage_media_video ON stage_media(video_id)")
+    conn.execute(
+        """
+        UPDATE stage_media SET
+          db_attr_hash = CASE WHEN video_id IS NULL THEN NULL ELSE mp_attr_hash(
+            (SELECT group_concat(t.norm, char(31))
+               FROM media_tags mt JOIN tag t ON t.id = mt.tag_id
+              WHERE mt.media_id = stage_media.video_id),
+            (SELECT group_concat(p.norm, char(31))
+               FROM media_performers mp JOIN performer p ON p.id = mp.performer_id
+              WHERE mp.media_id = stage_media.video_id)
+          ) END,
+          db_meta_hash = CASE WHEN video_id IS NULL OR has_meta = 0 THEN NULL ELSE (
+            SELECT mp_meta_hash(v.description, v.rating, v.favorite)
+              FROM video v WHERE v.id = stage_media.video_id
+          ) END
+        """
+    )
+
+
+def _merge_staged(conn) -> dict[str, int]:
+    now = int(time.time())
+    attr_changed = conn.execute(
+        "SELECT COUNT(*) FROM stage_media WHERE attr_hash IS NOT db_attr_hash"
+    ).fetchone()[0]
+    meta_changed = conn.execute(
+        "SELECT COUNT(*) FROM stage_media WHERE has_meta = 1 AND meta_hash IS NOT db_meta_hash"
+    ).fetchone()[0]
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO video (rel_path, mtime_ns, favorite, created_at, updated_at)
+        SELECT rel_path, 0, 0, ?, ? FROM stage_media WHERE video_id IS NULL
+        """,
+        (now, now),
+    )
+    conn.execute(
+        """
+        UPDATE stage_media SET video_id = (SELECT v.id FROM video v WHERE v.rel_path = stage_media.rel_path)
+         WHERE video_id IS NULL
+        """
+    )
+    for link, column, registry, stage in _BULK_LINKS:
+        changed = "SELECT rel_path FROM stage_media WHERE attr_hash IS NOT db_attr_hash"
+        extra_cols = "color, created_at" if registry == "tag" else "image_path, bio, created_at"
+        extra_vals = "NULL, ?" if registry == "tag" else "NULL, NULL, ?"
+        conn.execute(
+            f"""
+            INSERT OR IGNORE INTO {registry} (name, norm, {extra_cols})
+            SELECT name, norm, {extra_vals} FROM {stage}
+             WHERE rel_path IN ({changed})
+             GROUP BY norm
+            """,
+            (now,),
+        )
+        # Latest display spelling among the changed rows wins, as with the per-path
+        # registry helpers (which only run for paths being written).
+        latest = f"""
+            SELECT s.name FROM {stage} s
+             WHERE s.norm = {registry}.norm AND s.rel_path IN ({changed})
+             ORDER BY s.rowid DESC LIMIT 1
+        """
+        conn.execute(
+            f"""
+            UPDATE OR IGNORE {registry} SET name = ({latest})
+             WHERE norm IN (SELECT norm FROM {stage} WHERE rel_path IN ({changed}))
+               AND name <> ({latest})
+            """
+        )
+        conn.execute(
+            f"""
+            DELETE FROM {link}
+             WHERE media_id IN (SELECT video_id FROM stage_media WHERE attr_hash IS NOT db_attr_hash)
+               AND {column} NOT IN (
+                SELECT r.id FROM stage_media sm
+                  JOIN {stage} s ON s.rel_path = sm.rel_path
+                  JOIN {registry} r ON r.norm = s.norm
+                 WHERE sm.video_id = {link}.media_id
+               )
+            """
+        )
+        conn.execute(
+            f"""
+            INSERT OR IGNORE INTO {link} (media_id, {column})
+            SELECT sm.video_id, r.id FROM stage_media sm
+              JOIN {stage} s ON s.rel_path = sm.rel_path
+              JOIN {registry} r ON r.norm = s.norm
+             WHERE sm.attr_hash IS NOT sm.db_attr_hash
+            """
+        )
+    conn.execute(
+        """
+        UPDATE video SET
+          description = (SELECT sm.description FROM stage_media sm WHERE sm.video_id = video.id),
+          rating = (SELECT sm.rating FROM stage_media sm WHERE sm.video_id = video.id),
+          favorite = (SELECT sm.favorite FROM stage_media sm WHERE sm.video_id = video.id),
+          updated_at = ?
+         WHERE id IN (SELECT video_id FROM stage_media WHERE has_meta = 1 AND meta_hash IS NOT db_meta_hash)
+        """,
+        (now,),
+    )
+    conn.execute(
+        """
+        UPDATE video SET updated_at = ?
+         WHERE updated_at <> ?
+           AND id IN (SELECT video_id FROM stage_media WHERE attr_hash IS NOT db_attr_hash)
+        """,
+        (now, now),
+    )
+    unchanged = conn.execute(
+        """
+        SELECT COUNT(*) FROM stage_media
+         WHERE attr_hash IS db_attr_hash
+           AND NOT (has_meta = 1 AND meta_hash IS NOT db_meta_hash)
+        """
+    ).fetchone()[0]
+    return {
+        "media_attr_rows": int(attr_changed),
+        "metadata_rows": int(meta_changed),
+        "unchanged_rows": int(unchanged),
+    }
+
+
+def _digest_row_hashes(pairs: Iterable[Tuple[str, Optional[str]]]) -> str:
+    h = hashlib.sha256()
+    for rel, row_hash in pairs:
+        h.update(f"{rel}\t{row_hash or '-'}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def bulk_import(
+    attr_map: dict[str, dict[str, list[str]]],
+    meta_map: dict[str, dict[str, Any]],
+    *,
+    apply: bool,
+    diff_limit: int = 20,
+) -> dict[str, Any]:
+    """Stage every row into temp tables and merge/verify with set-based SQL.
+
+    Each staged row carries a hash of its sidecar content; the DB side is
+    hashed in place through SQL functions, so unchanged rows are skipped and
+    parity is a single comparison per row instead of per-path helper calls.
+    """
+    conn = DB.connect()  # type: ignore
+    try:
+        conn.create_function("mp_attr_hash", 2, _attr_row_hash, deterministic=True)
+        conn.create_function("mp_meta_hash", 3, _meta_row_hash, deterministic=True)
+        _stage_rows(conn, attr_map, meta_map)
+        _refresh_db_hashes(conn)
+        if apply:
+            apply_stats = _merge_staged(conn)
+            _refresh_db_hashes(conn)
+        else:
+            apply_stats = {"media_attr_rows": 0, "metadata_rows": 0, "unchanged_rows": 0}
+        attr_rows = conn.execute(
+            "SELECT rel_path, attr_hash, db_attr_hash, video_id FROM stage_media ORDER BY rel_path"
+        ).fetchall()
+        meta_rows = conn.execute(
+            "SELECT rel_path, meta_hash, db_meta_hash, video_id FROM stage_media WHERE has_meta = 1 ORDER BY rel_path"
+        ).fetchall()
+        if apply:
+            conn.commit()
+        else:
+            conn.rollback()
+    finally:
+        conn.close()
+
+    def _section(rows, source: dict[str, dict[str, Any]], fetcher) -> dict[str, Any]:
+        missing = [str(r[0]) for r in rows if r[3] is None]
+        drifted = [str(r[0]) for r in rows if r[3] is not None and r[1] != r[2]]
+        dest, _ = fetcher(drifted[:diff_limit])
+        diffs = [{"path": rel, "sidecar": source[rel], "db": None} for rel in missing[:diff_limit]]
+        diffs += [
+            {"path": rel, "sidecar": source[rel], "db": dest.get(rel)}
+            for rel in drifted[: max(0, diff_limit - len(diffs))]
+        ]
+        return {
+            "sidecar_count": len(rows),
+            "db_count": len(rows) - len(missing),
+            "sidecar_digest": _digest_row_hashes((r[0], r[1]) for r in rows),
+            "db_digest": _digest_row_hashes((r[0], r[2]) for r in rows),
+            "diffs": diffs,
+            "missing_in_db": missing,
+        }
+
+    return {
+        "media_attr": _section(attr_rows, attr_map, fetch_db_media_attr),
+        "metadata": _section(meta_rows, meta_map, fetch_db_metadata),
+        "apply_stats": apply_stats,
+    }
+
+
 # ---------------------------------------------------------------------------
 # Archiving / deletion helpers
 # ---------------------------------------------------------------------------
@@ -476,6 +807,8 @@ def build_parser() -> argparse.ArgumentParser:
     ap.add_argument("--archive-dir", default=None, help="Optional destination for archived files (requires --archive)")
     ap.add_argument("--delete", action="store_true", help="Delete JSON files after a clean verification (implies --apply)")
     ap.add_argument("--json", action="store_true", help="Emit the final summary as JSON instead of human text")
+    ap.add_argument("--bulk", action="store_true", help="Stage rows into temp tables and merge/verify with set-based SQL (large libraries)")
+    ap.add_argument("--workers", type=int, default=None, help="Threads used to parse *.tags.json sidecars (default: auto)")
     return ap
 
 
@@ -548,7 +881,8 @@ def main(argv: list[str]) -> int:
     attr_index_path = root / ".artifacts" / "scenes.json"
     media_attr_map, index_warnings = load_media_attr_index(attr_index_path)
     stem_index = build_stem_index(APP, root, media_attr_map)
-    metadata_map, metadata_sources, tag_stats = load_tags_sidecars(root, stem_index)
+    workers = args.workers if args.workers is not None else _default_workers()
+    metadata_map, metadata_sources, tag_stats = load_tags_sidecars(root, stem_index, workers=max(1, workers))
     merged_attr_map = merge_attr_sources(media_attr_map, metadata_map)
 
     all_paths = sorted(merged_attr_map.keys())
@@ -560,39 +894,40 @@ def main(argv: list[str]) -> int:
     meta_map = {rel: metadata_map[rel] for rel in metadata_map.keys() if rel in limited_paths}
     meta_sources = {rel: metadata_sources[rel] for rel in metadata_sources if rel in limited_paths}
 
-    if args.apply:
-        apply_stats = apply_updates(attr_map, meta_map)
+    if args.bulk:
+        bulk = bulk_import(attr_map, meta_map, apply=args.apply)
+        apply_stats = bulk["apply_stats"]
+        attr_section = bulk["media_attr"]
+        meta_section = bulk["metadata"]
     else:
-        apply_stats = {"media_attr_rows": 0, "metadata_rows": 0}
-
-    db_attr_map, missing_attr = fetch_db_media_attr(list(attr_map.keys()))
-    db_meta_map, missing_meta = fetch_db_metadata(list(meta_map.keys()))
-
-    attr_diff = diff_media_attr(attr_map, db_attr_map)
-    meta_diff = diff_metadata(meta_map, db_meta_map)
+        if args.apply:
+            apply_stats = apply_updates(attr_map, meta_map)
+        else:
+            apply_stats = {"media_attr_rows": 0, "metadata_rows": 0}
 
-    media_attr_digest = digest_media_attr_map(attr_map)
-    db_attr_digest = digest_media_attr_map(db_attr_map)
-    metadata_digest = digest_metadata_map(meta_map)
-    db_metadata_digest = digest_metadata_map(db_meta_map)
+        db_attr_map, missing_attr = fetch_db_media_attr(list(attr_map.keys()))
+        db_meta_map, missing_meta = fetch_db_metadata(list(meta_map.keys()))
 
-    summary: dict[str, Any] = {
-        "media_attr": {
+        attr_section = {
             "sidecar_count": len(attr_map),
             "db_count": len(db_attr_map),
-            "sidecar_digest": media_attr_digest,
-            "db_digest": db_attr_digest,
-            "diffs": attr_diff,
+            "sidecar_digest": digest_media_attr_map(attr_map),
+            "db_digest": digest_media_attr_map(db_attr_map),
+            "diffs": diff_media_attr(attr_map, db_attr_map),
             "missing_in_db": missing_attr,
-        },
-        "metadata": {
+        }
+        meta_section = {
             "sidecar_count": len(meta_map),
             "db_count": len(db_meta_map),
-            "sidecar_digest": metadata_digest,
-            "db_digest": db_metadata_digest,
-            "diffs": meta_diff,
+            "sidecar_digest": digest_metadata_map(meta_map),
+            "db_digest": digest_metadata_map(db_meta_map),
+            "diffs": diff_metadata(meta_map, db_meta_map),
             "missing_in_db": missing_meta,
-        },
+        }
+
+    summary: dict[str, Any] = {
+        "media_attr": attr_section,
+        "metadata": meta_section,
         "tags": tag_stats,
         "index_warnings": index_warnings,
         "apply_stats": apply_stats,
@@ -600,10 +935,10 @@ def main(argv: list[str]) -> int:
     }
 
     success = not (
-        attr_diff
-        or meta_diff
-        or missing_attr
-        or missing_meta
+        attr_section["diffs"]
+        or meta_section["diffs"]
+        or attr_section["missing_in_db"]
+        or meta_section["missing_in_db"]
         or tag_stats["ambiguous"]
         or tag_stats["parse_errors"]
         or tag_stats["unmapped"]